@@ -0,0 +1,232 @@
+"""Benchmarks for the game's hot paths.
+
+Scenarios are data in bench_scenarios.json. Run them with
+
+    python bench.py --output before.json
+    python bench.py --output after.json --compare before.json
+
+Each scenario reports ticks/sec, p50/p99 tick time and peak traced memory.
+A session recorded with `python main.py --record session.json` becomes a
+scenario of kind "replay" with "log": "session.json" (and "render": true
+to include drawing). A "snapshot" key (a file saved with F5 or --autosave)
+starts a scenario from that state instead of an empty map.
+"""
+import argparse
+import heapq
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+# Render into an off-screen display so draw benchmarks run anywhere
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+import main
+
+SCENARIO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_scenarios.json")
+MEMORY_TICKS = 5  # Ticks run again under tracemalloc for the peak memory figure
+
+def make_grid(layout, size, seed=0):
+    """Open field or a perfect maze (recursive backtracker) as a Grid"""
+    grid = main.Grid(size, size)
+    if layout == "open":
+        return grid
+
+    rng = random.Random(seed)
+    open_cells = {(1, 1)}
+    stack = [(1, 1)]
+    while stack:
+        x, y = stack[-1]
+        options = [(x + dx, y + dy, dx, dy) for dx, dy in [(2, 0), (-2, 0), (0, 2), (0, -2)]
+                   if 0 < x + dx < size - 1 and 0 < y + dy < size - 1 and (x + dx, y + dy) not in open_cells]
+        if not options:
+            stack.pop()
+            continue
+        nx, ny, dx, dy = rng.choice(options)
+        open_cells.add((x + dx // 2, y + dy // 2))
+        open_cells.add((nx, ny))
+        stack.append((nx, ny))
+
+    grid.set_walls([(x, y) for y in range(size) for x in range(size) if (x, y) not in open_cells])
+    return grid
+
+def build_game(scenario, size=None):
+    """Game with the scenario's walls, towers and a frozen wave of enemies (on a size x size map)"""
+    rng = random.Random(0)
+    headless = scenario["kind"] in ("wave_update", "tower_update")
+    cols, rows = (size, size) if size else (main.COLS, main.ROWS)
+    game = main.Game(use_enemy_pool=scenario.get("enemy_pool", False), headless=headless, seed=0,
+                     cols=cols, rows=rows, snapshot=scenario.get("snapshot"))
+    width, height = game.grid.width, game.grid.height
+
+    # Map rows: '#' is a wall, 'T' a tower, anything else open ground
+    for y, row in enumerate(scenario.get("map", [])):
+        for x, cell in enumerate(row):
+            if cell == "#":
+                game.toggle_wall((x, y))
+            elif cell == "T":
+                game.place_tower((x, y))
+    for _ in range(scenario.get("towers", 0)):
+        pos = (rng.uniform(0, width), rng.uniform(0, height))
+        game.towers.append(main.Tower(pos, game))
+
+    # Replace the wave schedule with the scenario's enemies, already spawned
+    wave_manager = game.wave_manager
+    wave_manager.waves = []
+    wave_manager.wave_countdown = 0
+    wave_manager.wave_began = 0
+    enemies = scenario.get("enemies", {})
+    wave_manager.current_wave_obj = main.Wave(sum(enemies.values()), list(enemies), spawn_delay=0)
+    wave_manager.current_wave_obj.enemies_spawned = sum(enemies.values())
+    for enemy_type, count in enemies.items():
+        for _ in range(count):
+            enemy = wave_manager.spawn_enemy(enemy_type)
+            enemy.pos = pygame.Vector2(rng.uniform(0, width), rng.uniform(0, height))
+            enemy.calculate_path()
+    wave_manager.index_enemies()
+    return game
+
+def make_tick(scenario, size=None):
+    """Set up a scenario and return the function that runs one tick of it"""
+    kind = scenario["kind"]
+    if kind == "astar":
+        grid = make_grid(scenario["layout"], size)
+        start, goal = (1, 1), (size - 2, size - 2)
+        return lambda tick: main.a_star(start, goal, grid)
+
+    if kind == "replay":
+        render = scenario.get("render", False)
+        session = main.Replay(main.InputLog.load(scenario["log"]), headless=not render)
+        def tick(tick):
+            session.step()
+            if render:
+                session.game.draw()
+                pygame.display.flip()
+        return tick
+
+    game = build_game(scenario, size)
+    if kind == "wave_update":
+        def tick(tick):
+            game.index_towers()
+            game.wave_manager.update(tick * main.SIM_STEP_MS)
+    elif kind == "tower_update":
+        # Only the towers' shots: the frozen enemies hold their fire
+        game.scheduler.queue = [event for event in game.scheduler.queue
+                                if isinstance(getattr(event[2], "__self__", None), main.Tower)]
+        heapq.heapify(game.scheduler.queue)
+        def tick(tick):
+            game.scheduler.run_until(tick * main.SIM_STEP_MS)
+            game.projectiles.update()
+    elif kind == "grid_draw":
+        def tick(tick):
+            game.grid.draw(game.screen, game.camera)
+    elif kind == "frame":
+        def tick(tick):
+            game.update(tick * main.SIM_STEP_MS)
+            game.draw()
+            pygame.display.flip()
+    elif kind == "draw":
+        # Drawing alone, of a frozen frame
+        game.index_towers()
+        def tick(tick):
+            game.draw()
+            pygame.display.flip()
+    else:
+        raise ValueError(f"Unknown scenario kind: {kind}")
+    return tick
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+def run_case(scenario, size=None):
+    ticks = scenario["ticks"]
+
+    # Timed pass
+    tick = make_tick(scenario, size)
+    durations = []
+    for n in range(1, ticks + 1):
+        started = time.perf_counter()
+        tick(n)
+        durations.append(time.perf_counter() - started)
+
+    # Peak memory pass, setup included
+    tracemalloc.start()
+    tick = make_tick(scenario, size)
+    for n in range(1, min(ticks, MEMORY_TICKS) + 1):
+        tick(n)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations.sort()
+    return {
+        "ticks": ticks,
+        "ticks_per_sec": ticks / sum(durations),
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+        "peak_kb": peak / 1024,
+    }
+
+def run_all(scenarios, only=None):
+    results = {}
+    for scenario in scenarios:
+        for size in scenario.get("sizes", [None]):
+            name = scenario["name"] if size is None else f"{scenario['name']}@{size}"
+            if only and only not in name:
+                continue
+            results[name] = run_case(scenario, size)
+            print_result(name, results[name])
+    return results
+
+def print_result(name, result):
+    print(f"{name:24} {result['ticks_per_sec']:10.1f} ticks/s  p50 {result['p50_ms']:8.3f} ms  "
+          f"p99 {result['p99_ms']:8.3f} ms  peak {result['peak_kb']:9.1f} KiB")
+
+def print_comparison(old, new):
+    print()
+    print(f"{'scenario':24} {'old ticks/s':>12} {'new ticks/s':>12} {'change':>8} {'old p99':>9} {'new p99':>9}")
+    for name, result in new["results"].items():
+        before = old["results"].get(name)
+        if before is None:
+            continue
+        change = result["ticks_per_sec"] / before["ticks_per_sec"] - 1
+        print(f"{name:24} {before['ticks_per_sec']:12.1f} {result['ticks_per_sec']:12.1f} "
+              f"{change:+8.1%} {before['p99_ms']:9.3f} {result['p99_ms']:9.3f}")
+
+def current_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the game's hot paths")
+    parser.add_argument("--scenarios", default=SCENARIO_FILE, help="scenario JSON file")
+    parser.add_argument("--only", help="run scenarios whose name contains this text")
+    parser.add_argument("--output", help="write results as JSON for later comparison")
+    parser.add_argument("--compare", help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+
+    report = {
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "results": run_all(scenarios, args.only),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == "__main__":
+    main_cli()
@@ -1,16 +1,31 @@
-import pygame
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import csv
 import heapq
+import json
+import os
 import random
 import math
+import time
+import types
+import numpy as np
 
-pygame.init()
+# Importing the module opens nothing: the window is created by a Game that renders
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import pygame
 
 # Screen and grid settings
 WIDTH, HEIGHT = 600, 600
 GRID_SIZE = 50  # Size of each cell
 ROWS, COLS = HEIGHT // GRID_SIZE, WIDTH // GRID_SIZE
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-clock = pygame.time.Clock()
+SIM_STEP_MS = 1000 / 60  # Fixed simulation timestep (one frame at 60 FPS)
+MAX_FRAME_MS = 250  # Longest real frame the simulation catches up on
+IDLE_RETRY_MS = 100  # How soon a shooter with nothing in range looks again
+SPEEDS = {pygame.K_1: 1, pygame.K_2: 2, pygame.K_3: 4, pygame.K_4: 8}  # Fast-forward keys
+AUTOSAVE_TICKS = 60 * 60  # One minute of game time between autosaves
+QUICKSAVE_FILE = "quicksave.npz"
 
 # Colors
 BACKGROUND = (30, 30, 30)
@@ -20,16 +35,141 @@ BASE_COLOR = (0, 200, 0)
 PATH_COLOR = (100, 100, 255)
 WALL_COLOR = (150, 150, 150)
 
-# Define a simple grid (0 = walkable, 1 = wall)
-grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
-
-# Set the home base in the center of the grid
-base_x, base_y = COLS // 2, ROWS // 2
-grid[base_y][base_x] = 2  # Mark the home base position
+# Cell flags stored in Grid.cells
+WALKABLE = 1
+WALL = 2
+BASE = 4
+TOWER = 8
 
 # Enemy spawn point (top-left corner)
 enemy_start = (2, 2)  # Changed from (0, 0) to (1, 1) to ensure it's within the grid
 
+# Timed events
+class Scheduler:
+    """Timer heap that runs callbacks once the simulation clock reaches them.
+
+    Entries are [time, seq, callback, args]. seq keeps events due at the
+    same time in the order they were scheduled, so runs stay repeatable.
+    Nothing is polled: a unit waiting for its cooldown costs nothing per tick.
+    Events are never cancelled; a unit that is gone ignores its last wake.
+    """
+    def __init__(self):
+        self.queue = []
+        self.seq = 0
+
+    def at(self, time, callback, *args, seq=None):
+        if seq is None:
+            seq = self.seq
+            self.seq += 1
+        entry = [time, seq, callback, args]
+        heapq.heappush(self.queue, entry)
+        return entry
+
+    def run_until(self, now):
+        """Run every event due by now; callbacks get now and their own arguments"""
+        queue = self.queue
+        while queue and queue[0][0] <= now:
+            _, _, callback, args = heapq.heappop(queue)
+            callback(now, *args)
+
+# Built-in profiling
+class Profiler:
+    """Time spent per section and event counts, one row per frame.
+
+    Sections and counters keep a rolling window for the p50/p99 overlay.
+    When tracing, every frame's row is also kept for export to CSV or JSON.
+    """
+    WINDOW = 120  # Frames in the rolling window
+
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self.font = None
+        self.reset()
+
+    def reset(self):
+        """Forget every frame measured so far, for a new game"""
+        self.frame = 0
+        self.current = collections.defaultdict(float)  # Name -> ms or count this frame
+        self.history = {}  # Name -> deque of per-frame values
+        self.sections = []  # Timed names, in first-seen order
+        self.counters = []  # Counted names, in first-seen order
+        self.trace = []
+
+    @contextlib.contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] += (time.perf_counter() - started) * 1000
+            if name not in self.history:
+                self.history[name] = collections.deque(maxlen=self.WINDOW)
+                self.sections.append(name)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        self.current[name] += amount
+        if name not in self.history:
+            self.history[name] = collections.deque(maxlen=self.WINDOW)
+            self.counters.append(name)
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frame += 1
+        for name, values in self.history.items():
+            values.append(self.current.get(name, 0))
+        if self.tracing:
+            row = {"frame": self.frame}
+            row.update(self.current)
+            self.trace.append(row)
+        self.current = collections.defaultdict(float)
+
+    def percentile(self, name, fraction):
+        values = sorted(self.history[name])
+        return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0
+
+    def draw(self, screen):
+        """Overlay of p50/p99 per section and counter in the top right corner"""
+        if self.font is None:
+            self.font = pygame.font.Font(None, 20)
+        rows = [("", "p50", "p99")]
+        rows += [(f"{name} ms", f"{self.percentile(name, 0.5):.2f}", f"{self.percentile(name, 0.99):.2f}")
+                 for name in self.sections]
+        rows += [(name, f"{self.percentile(name, 0.5):.0f}", f"{self.percentile(name, 0.99):.0f}")
+                 for name in self.counters]
+        cells = [[self.font.render(text, True, (255, 255, 255)) for text in row] for row in rows]
+
+        # Names left aligned, numbers right aligned in their columns
+        widths = [max(row[column].get_width() for row in cells) + 10 for column in range(3)]
+        width = sum(widths) + 10
+        panel = pygame.Surface((width, 16 * len(cells) + 8), pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 160))
+        for i, (name, p50, p99) in enumerate(cells):
+            y = 4 + 16 * i
+            panel.blit(name, (5, y))
+            panel.blit(p50, (5 + widths[0] + widths[1] - p50.get_width(), y))
+            panel.blit(p99, (5 + sum(widths) - p99.get_width(), y))
+        screen.blit(panel, (screen.get_width() - width - 10, 10))
+
+    def export(self, path):
+        """Write the traced frames as JSON, or as CSV unless the file ends in .json"""
+        columns = ["frame"] + self.sections + self.counters
+        with open(path, "w", newline="") as f:
+            if path.endswith(".json"):
+                json.dump([{name: row.get(name, 0) for name in columns} for row in self.trace], f)
+            else:
+                writer = csv.DictWriter(f, columns, restval=0)
+                writer.writeheader()
+                writer.writerows(self.trace)
+
+profiler = Profiler()  # Shared so module-level functions like a_star can count
+
 # A* Pathfinding algorithm
 def heuristic(a, b):
     """Manhattan distance heuristic for A*"""
@@ -39,205 +179,1052 @@ def get_neighbors(node, grid):
     """Returns valid neighbors for pathfinding"""
     x, y = node
     neighbors = [(x+1, y), (x-1, y), (x, y+1), (x, y-1)]
-    return [(nx, ny) for nx, ny in neighbors if 0 <= nx < COLS and 0 <= ny < ROWS and grid[ny][nx] != 1]
+    return [(nx, ny) for nx, ny in neighbors
+            if 0 <= nx < grid.cols and 0 <= ny < grid.rows and grid.walkable[ny * grid.cols + nx]]
 
-def a_star(start, goal, grid):
-    """A* pathfinding algorithm"""
-    open_set = []
-    heapq.heappush(open_set, (0, start))
+def a_star(start, goal, grid, bounds=None):
+    """A* pathfinding algorithm (nodes are flat cell indices internally)
+
+    bounds=(min_x, min_y, max_x, max_y) keeps the search inside a rectangle.
+    """
+    cols = grid.cols
+    min_x, min_y, max_x, max_y = bounds or (0, 0, grid.cols, grid.rows)
+    walkable = grid.walkable
+    goal_x, goal_y = goal
+    start_index = grid.index(start)
+    goal_index = grid.index(goal)
+
+    profiler.count("a_star")
+
+    open_set = [(heuristic(start, goal), start_index)]
     came_from = {}
-    g_score = {start: 0}
-    f_score = {start: heuristic(start, goal)}
+    g_score = {start_index: 0}
+    closed = set()
 
     while open_set:
         _, current = heapq.heappop(open_set)
 
-        if current == goal:
+        if current == goal_index:
+            profiler.count("nodes", len(closed))
             path = []
             while current in came_from:
-                path.append(current)
+                path.append(grid.cell(current))
                 current = came_from[current]
             return path[::-1]  # Return reversed path
 
-        for neighbor in get_neighbors(current, grid):
-            temp_g_score = g_score[current] + 1
-            if temp_g_score < g_score.get(neighbor, float('inf')):
-                came_from[neighbor] = current
-                g_score[neighbor] = temp_g_score
-                f_score[neighbor] = temp_g_score + heuristic(neighbor, goal)
-                heapq.heappush(open_set, (f_score[neighbor], neighbor))
+        if current in closed:
+            continue  # Stale queue entry
+        closed.add(current)
+
+        y, x = divmod(current, cols)
+        temp_g_score = g_score[current] + 1
+        for neighbor, nx, ny in ((current + 1, x + 1, y), (current - 1, x - 1, y),
+                                 (current + cols, x, y + 1), (current - cols, x, y - 1)):
+            if min_x <= nx < max_x and min_y <= ny < max_y and walkable[neighbor]:
+                if temp_g_score < g_score.get(neighbor, float('inf')):
+                    came_from[neighbor] = current
+                    g_score[neighbor] = temp_g_score
+                    f_score = temp_g_score + abs(nx - goal_x) + abs(ny - goal_y)
+                    heapq.heappush(open_set, (f_score, neighbor))
 
+    profiler.count("nodes", len(closed))
     return []  # No path found
 
+# Incremental pathfinding
+class IncrementalPlanner:
+    """Lifelong Planning A* (LPA*) searching backwards from the goal.
+
+    The search state is kept between calls, so after a wall changes only the
+    cells whose distance to the goal actually changed are visited again.
+    Cells are flat grid indices internally; the public methods take (x, y).
+    """
+    def __init__(self):
+        self.goal = None
+        self.grid = None
+        self.g = []    # Settled distance to the goal, per cell index
+        self.rhs = []  # One-step lookahead distance to the goal
+        self.open_set = []
+
+    def reset(self, goal, grid):
+        """Forget all search state and plan towards a new goal"""
+        self.goal = goal
+        self.grid = grid
+        self.goal_index = grid.index(goal)
+        self.g = [float('inf')] * (grid.cols * grid.rows)
+        self.rhs = [float('inf')] * (grid.cols * grid.rows)
+        self.rhs[self.goal_index] = 0
+        self.open_set = [(0, self.goal_index)]
+
+    def update_cell(self, index):
+        """Recompute a cell's lookahead distance and queue it if inconsistent"""
+        g = self.g
+        if index != self.goal_index:
+            walkable = self.grid.walkable
+            best_distance = float('inf')
+            for neighbor in self.grid.around(index):
+                if walkable[neighbor] and g[neighbor] + 1 < best_distance:
+                    best_distance = g[neighbor] + 1
+            self.rhs[index] = best_distance
+
+        if g[index] != self.rhs[index]:
+            heapq.heappush(self.open_set, (min(g[index], self.rhs[index]), index))
+
+    def compute(self, start=None, budget=None):
+        """Settle inconsistent cells until start is correct (or all of them if start is None).
+
+        Returns False, with the search left half done, once more than budget
+        cells have been popped; True when it finished.
+        """
+        g, rhs = self.g, self.rhs
+        walkable = self.grid.walkable
+        start_index = None if start is None else self.grid.index(start)
+        popped = 0
+
+        while self.open_set:
+            key, current = self.open_set[0]
+            if start_index is not None and g[start_index] == rhs[start_index] and \
+                    key >= g[start_index]:
+                break
+            heapq.heappop(self.open_set)
+
+            if g[current] == rhs[current] or key != min(g[current], rhs[current]):
+                continue  # Stale queue entry
+            popped += 1
+            if budget is not None and popped > budget:
+                return False
+
+            if g[current] > rhs[current]:
+                g[current] = rhs[current]
+            else:
+                g[current] = float('inf')
+                self.update_cell(current)
+
+            # Walls have no incoming edges, so nothing routes through them
+            if walkable[current]:
+                for neighbor in self.grid.around(current):
+                    self.update_cell(neighbor)
+        return True
+
+    def cell_changed(self, cell):
+        """Call after a cell becomes or stops being a wall"""
+        if self.grid is None:
+            return  # Nothing planned yet
+        for neighbor in self.grid.around(self.grid.index(cell)):
+            self.update_cell(neighbor)
+
+    def distance(self, cell):
+        """Steps from cell to the goal as currently known (inf if unreachable)"""
+        return self.g[self.grid.index(cell)]
+
+    def next_cell(self, cell):
+        """Neighbor of cell that is closest to the goal (None if unreachable)"""
+        index = self.grid.index(cell)
+        if index == self.goal_index:
+            return None
+
+        best_index = None
+        best_distance = float('inf')
+        walkable = self.grid.walkable
+        for neighbor in self.grid.around(index):
+            if walkable[neighbor] and self.g[neighbor] < best_distance:
+                best_index = neighbor
+                best_distance = self.g[neighbor]
+        return None if best_index is None else self.grid.cell(best_index)
+
+    def find_path(self, start, goal, grid):
+        """Same result as a_star(start, goal, grid), reusing earlier searches"""
+        if goal != self.goal or grid is not self.grid:
+            self.reset(goal, grid)
+        self.compute(start)
+
+        path = []
+        current = self.next_cell(start)
+        while current is not None:
+            path.append(current)
+            current = self.next_cell(current)
+        return path
+
+# Flow field navigation
+class FlowField(IncrementalPlanner):
+    """Distance field towards the goal, shared by every enemy"""
+    # Repairs that settle more than this fraction of the cells cost more than
+    # a fresh breadth-first fill, so they give up and fill instead
+    REPAIR_LIMIT = 0.02
+
+    def __init__(self, goal, grid, distances=None):
+        super().__init__()
+        if distances is None:
+            self.fill(goal, grid)
+        else:
+            # Distances saved from a settled field need no search at all
+            self.reset(goal, grid)
+            self.g = list(distances)
+            self.rhs = list(self.g)
+            self.open_set = []
+
+    def fill(self, goal, grid):
+        """Build every distance from scratch with one breadth-first search"""
+        self.reset(goal, grid)
+        g = self.g
+        walkable = grid.walkable
+        g[self.goal_index] = 0
+        frontier = [self.goal_index]
+        while frontier:
+            next_frontier = []
+            for current in frontier:
+                # Only walkable cells can be stepped onto on the way to the goal
+                if current != self.goal_index and not walkable[current]:
+                    continue
+                distance = g[current] + 1
+                for neighbor in grid.around(current):
+                    if g[neighbor] == float('inf'):
+                        g[neighbor] = distance
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        self.rhs = list(g)
+        self.open_set = []
+
+    def cell_changed(self, cell):
+        """Repair every cell affected by the change so next_cell stays O(1)"""
+        super().cell_changed(cell)
+        if not self.compute(budget=self.REPAIR_LIMIT * len(self.g)):
+            self.fill(self.goal, self.grid)
+
+    def rebuild(self):
+        self.fill(self.goal, self.grid)
+
+# Reachability
+class Connectivity:
+    """Connected components of the walkable cells, repaired as walls change.
+
+    Each walkable cell carries a component label (-1 for walls), so whether
+    one cell can reach another is a single comparison. Opening a cell merges
+    the components around it. Closing one searches out from its neighbors in
+    turn until the searches meet again; only pieces that were cut off get
+    new labels, so the cost follows the size of the detour, not of the map.
+    """
+    def __init__(self, grid, labels=None):
+        self.grid = grid
+        if labels is None:
+            self.rebuild()
+        else:
+            # Labels saved with the grid need no flood fill
+            self.labels = np.array(labels, dtype=np.int32)
+            self.next_label = int(self.labels.max()) + 1
+
+    def rebuild(self):
+        """Label every component from scratch, one flood fill each"""
+        grid = self.grid
+        walkable = grid.walkable
+        labels = [-1] * len(walkable)
+        label = 0
+        for first in range(len(walkable)):
+            if not walkable[first] or labels[first] >= 0:
+                continue
+            labels[first] = label
+            frontier = [first]
+            for current in frontier:
+                for neighbor in grid.around(current):
+                    if walkable[neighbor] and labels[neighbor] < 0:
+                        labels[neighbor] = label
+                        frontier.append(neighbor)
+            label += 1
+        self.labels = np.array(labels, dtype=np.int32)
+        self.next_label = label
+
+    def cell_changed(self, cell):
+        grid = self.grid
+        index = grid.index(cell)
+        labels = self.labels
+        if grid.walkable[index] and labels[index] < 0:
+            # Opened: it joins every component next to it into one
+            around = {int(labels[neighbor]) for neighbor in grid.around(index) if grid.walkable[neighbor]}
+            if not around:
+                labels[index] = self.new_label()
+                return
+            keep = min(around)
+            labels[index] = keep
+            around.discard(keep)
+            if around:
+                labels[np.isin(labels, list(around))] = keep
+        elif not grid.walkable[index] and labels[index] >= 0:
+            # Closed: the neighbors that can no longer reach each other split apart
+            labels[index] = -1
+            for piece in self.cut_off(index):
+                labels[piece] = self.new_label()
+
+    def new_label(self):
+        self.next_label += 1
+        return self.next_label - 1
+
+    def cut_off(self, blocked):
+        """Cell indices of each piece that a wall on blocked would cut off.
+
+        One breadth-first search per walkable neighbor of blocked takes a
+        step in turn; searches that touch are one piece and carry on as one.
+        A search that runs out of cells is a piece on its own. The last
+        search still going holds the rest of the component and is left out.
+        """
+        grid = self.grid
+        walkable = grid.walkable
+        starts = [neighbor for neighbor in grid.around(blocked) if walkable[neighbor]]
+        owner = {start: number for number, start in enumerate(starts)}
+        merged_into = list(range(len(starts)))
+        frontiers = {number: collections.deque([start]) for number, start in enumerate(starts)}
+        visited = {number: [start] for number, start in enumerate(starts)}
+        pieces = []
+
+        while len(frontiers) > 1:
+            for number in list(frontiers):
+                frontier = frontiers.get(number)
+                if frontier is None:
+                    continue  # Merged into another search this round
+                if not frontier:
+                    pieces.append(visited.pop(number))
+                    del frontiers[number]
+                    continue
+                current = frontier.popleft()
+                for neighbor in grid.around(current):
+                    if neighbor == blocked or not walkable[neighbor]:
+                        continue
+                    other = owner.get(neighbor)
+                    if other is None:
+                        owner[neighbor] = number
+                        frontier.append(neighbor)
+                        visited[number].append(neighbor)
+                        continue
+                    while merged_into[other] != other:
+                        other = merged_into[other]
+                    if other != number:
+                        merged_into[other] = number
+                        frontier.extend(frontiers.pop(other))
+                        visited[number].extend(visited.pop(other))
+        return pieces
+
+    def reaches(self, start, goal):
+        """Whether start can walk to goal; a start inside a wall steps out to its neighbors first"""
+        grid = self.grid
+        labels = self.labels
+        goal_label = labels[grid.index(goal)]
+        index = grid.index(start)
+        if grid.walkable[index]:
+            return labels[index] == goal_label
+        return any(grid.walkable[neighbor] and labels[neighbor] == goal_label
+                   for neighbor in grid.around(index))
+
+    def would_seal(self, cell, goal, sources):
+        """Whether a wall on cell would cut any of sources off from goal.
+
+        Sources that cannot reach goal already do not count. Nothing is
+        changed; the same search as closing the cell is run and thrown away.
+        """
+        grid = self.grid
+        labels = self.labels
+        blocked = grid.index(cell)
+        goal_index = grid.index(goal)
+        if not grid.walkable[blocked] or blocked == goal_index or labels[blocked] != labels[goal_index]:
+            return False
+        sources = [source for source in sources if self.reaches(source, goal)]
+        if not sources:
+            return False
+
+        piece_of = {}
+        for number, piece in enumerate(self.cut_off(blocked)):
+            for index in piece:
+                piece_of[index] = number
+        goal_piece = piece_of.get(goal_index)
+        component = labels[goal_index]
+
+        def still_reaches(index):
+            return (index != blocked and grid.walkable[index] and labels[index] == component
+                    and piece_of.get(index) == goal_piece)
+
+        for source in sources:
+            index = grid.index(source)
+            if index != blocked and grid.walkable[index]:
+                if not still_reaches(index):
+                    return True
+            elif not any(still_reaches(neighbor) for neighbor in grid.around(index)):
+                return True
+        return False
+
+# Hierarchical pathfinding for large maps
+class HierarchicalPlanner:
+    """HPA*: pathfinding over clusters of cells instead of single cells.
+
+    The grid is split into square clusters. Open stretches along each
+    cluster border become entrances, and walking distances between the
+    entrances of a cluster are precomputed. A query searches that small
+    abstract graph first and only turns the next segment into cells when
+    it is needed. A wall change rebuilds just the cluster it falls in
+    (and its neighbor when the wall sits on their shared border).
+    """
+    def __init__(self, grid, cluster_size=16):
+        self.grid = grid
+        self.cluster_size = cluster_size
+        self.rebuild()
+
+    def rebuild(self):
+        """Recompute every entrance and cluster from scratch"""
+        self.clusters_x = -(-self.grid.cols // self.cluster_size)
+        self.clusters_y = -(-self.grid.rows // self.cluster_size)
+        self.transitions = {}  # (cluster, cluster below or to the right) -> [(node, node)]
+        self.links = {}  # node -> nodes one step away across a cluster border
+        self.edges = {}  # cluster -> {node: {node: walking distance inside the cluster}}
+
+        clusters = [(cx, cy) for cy in range(self.clusters_y) for cx in range(self.clusters_x)]
+        for cx, cy in clusters:
+            if cx + 1 < self.clusters_x:
+                self.build_border((cx, cy), (cx + 1, cy))
+            if cy + 1 < self.clusters_y:
+                self.build_border((cx, cy), (cx, cy + 1))
+        for cluster in clusters:
+            self.build_cluster(cluster)
+
+    def cluster_of(self, index):
+        y, x = divmod(index, self.grid.cols)
+        return (x // self.cluster_size, y // self.cluster_size)
+
+    def bounds(self, cluster):
+        min_x, min_y = cluster[0] * self.cluster_size, cluster[1] * self.cluster_size
+        return (min_x, min_y, min(min_x + self.cluster_size, self.grid.cols),
+                min(min_y + self.cluster_size, self.grid.rows))
+
+    def build_border(self, first, second):
+        """Find the entrances between two touching clusters"""
+        for a, b in self.transitions.get((first, second), []):
+            self.links[a].discard(b)
+            self.links[b].discard(a)
+
+        cols = self.grid.cols
+        walkable = self.grid.walkable
+        min_x, min_y, max_x, max_y = self.bounds(first)
+        if second[0] != first[0]:  # Vertical border on the right of first
+            pairs = [(y * cols + max_x - 1, y * cols + max_x) for y in range(min_y, max_y)]
+        else:  # Horizontal border below first
+            pairs = [((max_y - 1) * cols + x, max_y * cols + x) for x in range(min_x, max_x)]
+
+        # Each run of open pairs is one entrance: its middle, or both ends if it is long
+        chosen = []
+        run = []
+        for pair in pairs + [None]:
+            if pair is not None and walkable[pair[0]] and walkable[pair[1]]:
+                run.append(pair)
+                continue
+            if len(run) >= 6:
+                chosen.extend([run[0], run[-1]])
+            elif run:
+                chosen.append(run[len(run) // 2])
+            run = []
+
+        self.transitions[(first, second)] = chosen
+        for a, b in chosen:
+            self.links.setdefault(a, set()).add(b)
+            self.links.setdefault(b, set()).add(a)
+
+    def cluster_nodes(self, cluster):
+        """Entrance cells that lie inside a cluster"""
+        cx, cy = cluster
+        nodes = set()
+        for first, second in (((cx, cy), (cx + 1, cy)), ((cx, cy), (cx, cy + 1)),
+                              ((cx - 1, cy), (cx, cy)), ((cx, cy - 1), (cx, cy))):
+            for a, b in self.transitions.get((first, second), []):
+                nodes.add(a if first == cluster else b)
+        return nodes
+
+    def build_cluster(self, cluster):
+        """Precompute walking distances between a cluster's entrances"""
+        nodes = self.cluster_nodes(cluster)
+        self.edges[cluster] = {}
+        for node in nodes:
+            distances = self.distances_within(node, cluster, nodes)
+            self.edges[cluster][node] = {other: distance for other, distance in distances.items()
+                                         if other != node}
+
+    def distances_within(self, source, cluster, targets):
+        """Breadth-first distances from source to the targets it can reach inside cluster"""
+        min_x, min_y, max_x, max_y = self.bounds(cluster)
+        cols = self.grid.cols
+        walkable = self.grid.walkable
+        distance = {source: 0}
+        found = {}
+        frontier = [source]
+        steps = 0
+        while frontier and len(found) < len(targets):
+            next_frontier = []
+            for current in frontier:
+                if current in targets:
+                    found[current] = steps
+                y, x = divmod(current, cols)
+                for neighbor, nx, ny in ((current + 1, x + 1, y), (current - 1, x - 1, y),
+                                         (current + cols, x, y + 1), (current - cols, x, y - 1)):
+                    if min_x <= nx < max_x and min_y <= ny < max_y and walkable[neighbor] \
+                            and neighbor not in distance:
+                        distance[neighbor] = steps + 1
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+            steps += 1
+        return found
+
+    def cell_changed(self, cell):
+        """Rebuild only the cluster holding cell, plus a neighbor sharing its border"""
+        index = self.grid.index(cell)
+        cluster = self.cluster_of(index)
+        min_x, min_y, max_x, max_y = self.bounds(cluster)
+        cx, cy = cluster
+        affected = {cluster}
+
+        x, y = cell
+        if x == max_x - 1 and cx + 1 < self.clusters_x:
+            self.build_border(cluster, (cx + 1, cy))
+            affected.add((cx + 1, cy))
+        if x == min_x and cx > 0:
+            self.build_border((cx - 1, cy), cluster)
+            affected.add((cx - 1, cy))
+        if y == max_y - 1 and cy + 1 < self.clusters_y:
+            self.build_border(cluster, (cx, cy + 1))
+            affected.add((cx, cy + 1))
+        if y == min_y and cy > 0:
+            self.build_border((cx, cy - 1), cluster)
+            affected.add((cx, cy - 1))
+
+        for changed in affected:
+            self.build_cluster(changed)
+
+    def find_path(self, start, goal, grid):
+        """Like a_star(start, goal, grid), but the cells are refined lazily as the path is walked"""
+        start_index, goal_index = grid.index(start), grid.index(goal)
+        if start_index == goal_index:
+            return HierarchicalPath(self, [])
+        goal_cluster = self.cluster_of(goal_index)
+
+        # Temporary edges linking start and goal into the abstract graph.
+        # An enemy standing on a wall steps off it first, maybe into another cluster.
+        if grid.walkable[start_index]:
+            sources = [start_index]
+        else:
+            sources = [neighbor for neighbor in grid.around(start_index) if grid.walkable[neighbor]]
+        start_edges = {}
+        for source in sources:
+            cluster = self.cluster_of(source)
+            targets = self.cluster_nodes(cluster)
+            if cluster == goal_cluster:
+                targets.add(goal_index)
+            step = 0 if source == start_index else 1
+            for node, distance in self.distances_within(source, cluster, targets).items():
+                if distance + step < start_edges.get(node, float('inf')):
+                    start_edges[node] = distance + step
+        goal_edges = self.distances_within(goal_index, goal_cluster, self.cluster_nodes(goal_cluster))
+
+        open_set = [(heuristic(start, goal), start_index)]
+        came_from = {}
+        g_score = {start_index: 0}
+        closed = set()
+        while open_set:
+            _, current = heapq.heappop(open_set)
+            if current == goal_index:
+                nodes = [current]
+                while current in came_from:
+                    current = came_from[current]
+                    nodes.append(current)
+                return HierarchicalPath(self, nodes[::-1])
+
+            if current in closed:
+                continue
+            closed.add(current)
+
+            if current == start_index:
+                neighbors = list(start_edges.items())
+            else:
+                neighbors = list(self.edges[self.cluster_of(current)].get(current, {}).items())
+            neighbors.extend((linked, 1) for linked in self.links.get(current, ()))
+            if current in goal_edges:
+                neighbors.append((goal_index, goal_edges[current]))
+
+            for neighbor, cost in neighbors:
+                temp_g_score = g_score[current] + cost
+                if temp_g_score < g_score.get(neighbor, float('inf')):
+                    came_from[neighbor] = current
+                    g_score[neighbor] = temp_g_score
+                    f_score = temp_g_score + heuristic(grid.cell(neighbor), goal)
+                    heapq.heappush(open_set, (f_score, neighbor))
+
+        return HierarchicalPath(self, [])  # No path found
+
+    def refine(self, a, b):
+        """Cells walked from node a to node b, excluding a"""
+        if a == b:
+            return []
+        if b in self.links.get(a, ()):
+            return [self.grid.cell(b)]
+        return a_star(self.grid.cell(a), self.grid.cell(b), self.grid, self.bounds(self.cluster_of(b)))
+
+class HierarchicalPath:
+    """Cells of an HPA* route, produced one abstract segment at a time"""
+    def __init__(self, planner, nodes):
+        self.planner = planner
+        self.nodes = nodes  # Abstract route as cell indices, start first
+        self.segment = 0
+        self.pending = []
+
+    def __bool__(self):
+        return bool(self.pending) or self.segment + 1 < len(self.nodes)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while not self.pending:
+            if self.segment + 1 >= len(self.nodes):
+                raise StopIteration
+            a, b = self.nodes[self.segment], self.nodes[self.segment + 1]
+            self.segment += 1
+            self.pending = self.planner.refine(a, b)[::-1]
+        return self.pending.pop()
+
+# Path solving off the main thread
+class GridSnapshot:
+    """Picklable copy of a grid's walkability, enough for a_star in another process"""
+    def __init__(self, grid):
+        self.cols, self.rows = grid.cols, grid.rows
+        self.walkable = bytes(grid.walkable)
+        self.version = grid.walls_version
+
+    def index(self, cell):
+        return cell[1] * self.cols + cell[0]
+
+    def cell(self, index):
+        y, x = divmod(index, self.cols)
+        return (x, y)
+
+def solve_paths(snapshot, starts, goal):
+    """Worker entry point: one a_star path per start, all on the same snapshot"""
+    return [a_star(start, goal, snapshot) for start in starts]
+
+class PathWorkers:
+    """Path requests solved on a process pool so a frame never waits for A*.
+
+    Requests made during a frame are sent together by submit(), grouped by
+    start cell and split across the workers, with one snapshot of the grid.
+    collect() hands finished paths over without blocking; a path solved for
+    grid whose walls have changed since is thrown away and asked for again.
+    A wall change costs the main thread only the connectivity update, as no
+    flow field is kept repaired in this mode.
+    """
+    BATCH = 8  # Fewest start cells worth sending to a worker as one task
+
+    def __init__(self, grid, workers=None):
+        self.grid = grid
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+        self.queued = {}  # enemy -> start cell, waiting for the next submit()
+        self.pending = {}  # enemy -> (future, offset in its result list, walls version)
+
+    def request(self, enemy, start):
+        self.queued[enemy] = start
+
+    def submit(self):
+        if not self.queued:
+            return
+        snapshot = GridSnapshot(self.grid)
+        by_start = {}
+        for enemy, start in self.queued.items():
+            by_start.setdefault(start, []).append(enemy)
+        self.queued = {}
+
+        starts = list(by_start)
+        size = max(self.BATCH, -(-len(starts) // self.workers))
+        for first in range(0, len(starts), size):
+            chunk = starts[first:first + size]
+            future = self.executor.submit(solve_paths, snapshot, chunk, self.grid.base)
+            for offset, start in enumerate(chunk):
+                for enemy in by_start[start]:
+                    self.pending[enemy] = (future, offset, snapshot.version)
+
+    def collect(self):
+        for enemy, (future, offset, version) in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[enemy]
+            if enemy.is_dead or enemy.reached_base:
+                continue
+            if version != self.grid.walls_version:
+                enemy.calculate_path()  # Stale: the walls changed after the snapshot
+            else:
+                enemy.follow(future.result()[offset])
+
+    def greedy_step(self, cell):
+        """Walkable neighbor closer to the base in a straight line (None if there is none)"""
+        grid = self.grid
+        best = None
+        best_distance = heuristic(cell, grid.base)
+        for neighbor in grid.around(grid.index(cell)):
+            if grid.walkable[neighbor]:
+                distance = heuristic(grid.cell(neighbor), grid.base)
+                if distance < best_distance:
+                    best = grid.cell(neighbor)
+                    best_distance = distance
+        return best
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+# Spatial index for range queries
+class SpatialHash:
+    """Uniform grid of buckets answering "what is near this point" queries"""
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def clear(self):
+        self.buckets.clear()
+
+    def insert(self, item, pos):
+        key = (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [item]
+        else:
+            bucket.append(item)
+
+    def remove(self, item, pos):
+        key = (int(pos[0] // self.cell_size), int(pos[1] // self.cell_size))
+        bucket = self.buckets[key]
+        bucket.remove(item)
+        if not bucket:
+            del self.buckets[key]
+
+    def query(self, pos, radius):
+        """Candidates from every bucket overlapping the circle (caller checks exact distance)"""
+        return self.query_rect(pos[0] - radius, pos[1] - radius, pos[0] + radius, pos[1] + radius)
+
+    def query_rect(self, left, top, right, bottom):
+        """Candidates from every bucket overlapping the rectangle"""
+        min_x = int(left // self.cell_size)
+        max_x = int(right // self.cell_size)
+        min_y = int(top // self.cell_size)
+        max_y = int(bottom // self.cell_size)
+
+        candidates = []
+        if (max_x - min_x + 1) * (max_y - min_y + 1) > len(self.buckets):
+            # Fewer occupied buckets than the query covers: walk the occupied ones
+            for (x, y), bucket in self.buckets.items():
+                if min_x <= x <= max_x and min_y <= y <= max_y:
+                    candidates.extend(bucket)
+            return candidates
+
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                bucket = self.buckets.get((x, y))
+                if bucket:
+                    candidates.extend(bucket)
+        return candidates
+
+# Viewport
+class Camera:
+    """The part of the world on screen: scrolled to (x, y) and scaled by zoom.
+
+    Positions are world pixels unless they are called screen positions.
+    Zoom steps between fixed levels so caches keyed on drawn sizes, like
+    the range overlays, stay small.
+    """
+    ZOOM_LEVELS = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0)
+    PAN_SPEED = 12  # Screen pixels per frame while an arrow key is held
+
+    def __init__(self, size, world_size):
+        self.width, self.height = size
+        self.world_width, self.world_height = world_size
+        self.x = self.y = 0.0  # World point at the screen's top left corner
+        self.zoom = 1.0
+
+    def to_screen(self, pos):
+        return ((pos[0] - self.x) * self.zoom, (pos[1] - self.y) * self.zoom)
+
+    def to_world(self, screen_pos):
+        return (screen_pos[0] / self.zoom + self.x, screen_pos[1] / self.zoom + self.y)
+
+    def view(self, margin=0):
+        """(left, top, right, bottom) of the visible world, widened by margin on every side"""
+        return (self.x - margin, self.y - margin,
+                self.x + self.width / self.zoom + margin, self.y + self.height / self.zoom + margin)
+
+    def pan(self, dx, dy):
+        """Scroll by a distance in screen pixels"""
+        self.x += dx / self.zoom
+        self.y += dy / self.zoom
+        self.clamp()
+
+    def zoom_by(self, steps, screen_pos):
+        """Move steps zoom levels in (or out when negative), keeping the point under screen_pos still"""
+        level = self.ZOOM_LEVELS.index(self.zoom) + steps
+        anchor = self.to_world(screen_pos)
+        self.zoom = self.ZOOM_LEVELS[max(0, min(level, len(self.ZOOM_LEVELS) - 1))]
+        self.x = anchor[0] - screen_pos[0] / self.zoom
+        self.y = anchor[1] - screen_pos[1] / self.zoom
+        self.clamp()
+
+    def clamp(self):
+        """Keep the view over the map, pinned to its top left corner when all of it fits"""
+        self.x = max(0, min(self.x, self.world_width - self.width / self.zoom))
+        self.y = max(0, min(self.y, self.world_height - self.height / self.zoom))
+
+# Sprites
+HEALTH_STEPS = 20  # Health bars are drawn in this many steps, one sprite each
+HEALTH_BAR_SIZE = (30, 5)  # World pixels
+
+SPRITE_KEY = (255, 0, 255)  # Transparent color of opaque sprites
+
+sprites = {}  # Pre-rendered surfaces, keyed on everything that shapes them
+
+def new_sprite(size):
+    """Empty color-keyed sprite in the screen's pixel format once a window exists.
+
+    Color keys are run-length encoded (RLEACCEL), so transparent pixels cost
+    nothing to blit, unlike per-pixel alpha.
+    """
+    sprite = pygame.Surface(size)
+    if pygame.display.get_surface():
+        sprite = sprite.convert()
+    sprite.fill(SPRITE_KEY)
+    sprite.set_colorkey(SPRITE_KEY, pygame.RLEACCEL)
+    return sprite
+
+def get_circle(radius, color):
+    """Filled circle (radius in screen pixels), rendered on first use and reused after.
+
+    An RGBA color gives a translucent circle, blended with one alpha for the
+    whole sprite.
+    """
+    key = ("circle", radius, color)
+    sprite = sprites.get(key)
+    if sprite is None:
+        sprite = new_sprite((radius * 2 + 1, radius * 2 + 1))
+        pygame.draw.circle(sprite, color[:3], (radius, radius), radius)
+        if len(color) == 4:
+            sprite.set_alpha(color[3], pygame.RLEACCEL)
+        sprites[key] = sprite
+    return sprite
+
+def get_health_bar(width, height, step):
+    """Red bar filled green for step out of HEALTH_STEPS"""
+    key = ("health", width, height, step)
+    sprite = sprites.get(key)
+    if sprite is None:
+        sprite = new_sprite((width, height))
+        sprite.fill((255, 0, 0))
+        sprite.fill((0, 255, 0), (0, 0, round(width * step / HEALTH_STEPS), height))
+        sprites[key] = sprite
+    return sprite
+
+def add_unit_sprites(batch, camera, units):
+    """Append the body and health bar of each tower or enemy to batch as Surface.blits arguments.
+
+    Sprites depend only on the zoom and each unit's look, so they are looked
+    up once per look and the per-unit work is a little arithmetic.
+    """
+    zoom = camera.zoom
+    left, top = camera.x, camera.y
+    width = max(1, int(HEALTH_BAR_SIZE[0] * zoom))
+    height = max(1, int(HEALTH_BAR_SIZE[1] * zoom))
+    bars = [get_health_bar(width, height, step) for step in range(HEALTH_STEPS + 1)]
+    half_bar = width // 2
+
+    looks = {}  # (color, size) -> (body sprite, its radius, health bar height above the center)
+    for unit in units:
+        look = looks.get((unit.color, unit.size))
+        if look is None:
+            radius = max(1, int(unit.size * zoom))
+            look = looks[unit.color, unit.size] = (get_circle(radius, unit.color), radius,
+                                                   int((unit.size + HEALTH_BAR_SIZE[1]) * zoom))
+        body, radius, rise = look
+        pos = unit.pos
+        x = int((pos[0] - left) * zoom)
+        y = int((pos[1] - top) * zoom)
+        batch.append((body, (x - radius, y - radius)))
+        step = max(0, min(HEALTH_STEPS, int(unit.health_ratio * HEALTH_STEPS + 0.5)))
+        batch.append((bars[step], (x - half_bar, y - rise)))
+
+# Enemy types, shared by every enemy of that type
+ENEMY_TYPES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "enemy_types.json")
+
+EnemyType = collections.namedtuple(
+    "EnemyType", "name speed health color size damage attack_speed range can_destroy_walls")
+
+def load_enemy_types(path=ENEMY_TYPES_FILE):
+    """Read enemy stats from a JSON file into a read-only name -> EnemyType mapping"""
+    with open(path) as f:
+        data = json.load(f)
+    enemy_types = {}
+    for name, stats in data.items():
+        color = tuple(stats["color"])
+        if color[:3] == SPRITE_KEY:  # Would be drawn fully transparent
+            raise ValueError(f"Enemy type {name!r} uses the sprite key color {SPRITE_KEY}")
+        enemy_types[name] = EnemyType(name=name, **dict(stats, color=color))
+    return types.MappingProxyType(enemy_types)
+
+ENEMY_TYPES = load_enemy_types()
+ENEMY_REACH = max(enemy_type.size for enemy_type in ENEMY_TYPES.values()) + 15  # Body and health bar
+
+def type_field(name):
+    """Read-only property for one stat of the enemy's shared type"""
+    return property(lambda self: getattr(self.type, name))
+
 # Enemy class
 class Enemy:
-    def __init__(self, enemy_type="basic", game=None):
-        # Enemy type configurations
-        self.enemy_types = {
-            "basic": {
-                "speed": 1,
-                "health": 100,
-                "color": (255, 0, 0),  # Red
-                "size": 20,
-                "damage": 10,
-                "attack_speed": 1.0,
-                "range": 150,
-                "can_destroy_walls": False
-            },
-            "fast": {
-                "speed": 2,
-                "health": 50,
-                "color": (0, 255, 0),  # Green
-                "size": 15,
-                "damage": 5,
-                "attack_speed": 2.0,
-                "range": 100,
-                "can_destroy_walls": False
-            },
-            "tank": {
-                "speed": 0.5,
-                "health": 200,
-                "color": (128, 128, 128),  # Gray
-                "size": 25,
-                "damage": 30,
-                "attack_speed": 0.5,
-                "range": 200,
-                "can_destroy_walls": True
-            }
-        }
-        
+    # Only per-enemy state is stored; stats are read from the shared type
+    __slots__ = ("type", "health", "pos", "waypoint", "route", "is_dead", "reached_base",
+                 "last_shot_time", "patrol_center", "patrol_angle", "game")
+    speed = type_field("speed")
+    color = type_field("color")
+    size = type_field("size")
+    damage = type_field("damage")
+    attack_speed = type_field("attack_speed")
+    range = type_field("range")
+    can_destroy_walls = type_field("can_destroy_walls")
+
+    # Patrol behavior
+    patrol_radius = 50
+    patrol_speed = 0.02
+
+    def __init__(self, enemy_type="basic", game=None, plan=True, start=enemy_start):
         # Set properties based on enemy type
-        self.type = enemy_type
-        self.stats = self.enemy_types[enemy_type]
-        self.speed = self.stats["speed"]
-        self.health = self.stats["health"]
-        self.color = self.stats["color"]
-        self.size = self.stats["size"]
-        self.damage = self.stats["damage"]
-        self.attack_speed = self.stats["attack_speed"]
-        self.range = self.stats["range"]
-        self.can_destroy_walls = self.stats["can_destroy_walls"]
+        self.type = ENEMY_TYPES[enemy_type]
+        self.health = self.type.health
         
         # Position and path variables
-        self.pos = pygame.Vector2(enemy_start[0] * GRID_SIZE, enemy_start[1] * GRID_SIZE)
-        self.path = []
-        self.current_path_index = 0
+        self.pos = pygame.Vector2(start[0] * GRID_SIZE, start[1] * GRID_SIZE)
+        self.waypoint = None  # Next cell to walk to, read from the grid's flow field
+        self.route = None  # Remaining HPA* path when the game navigates hierarchically
         self.is_dead = False
         self.reached_base = False
         
         # Combat variables
         self.last_shot_time = 0
-        self.bullets = []
         
         # Patrol behavior
-        self.patrol_radius = 50
         self.patrol_center = None
         self.patrol_angle = 0
-        self.patrol_speed = 0.02
         
         # Store game reference
         self.game = game
         
-        # Get initial path
-        self.calculate_path()
+        # Get initial path (skipped when the state comes from a snapshot)
+        if plan:
+            self.calculate_path()
+
+        # First chance to shoot, as soon as the cooldown allows
+        if game:
+            game.scheduler.at(self.last_shot_time + 1000 / self.attack_speed, self.wake)
 
     def clamp_to_grid(self, pos):
         """Keep position within grid boundaries"""
         # Add padding to prevent enemies from touching the edges
         padding = self.size + 5
-        x = max(padding, min(pos.x, WIDTH - padding))
-        y = max(padding, min(pos.y, HEIGHT - padding))
+        grid = self.game.grid
+        x = max(padding, min(pos.x, grid.width - padding))
+        y = max(padding, min(pos.y, grid.height - padding))
         return pygame.Vector2(x, y)
 
     def calculate_path(self):
-        """Recalculates the enemy's path when walls are placed."""
+        """Picks the next waypoint from the shared flow field when walls are placed."""
         if self.game:
             # Ensure we're using valid grid coordinates
-            grid_x = max(0, min(int(self.pos.x // GRID_SIZE), COLS - 1))
-            grid_y = max(0, min(int(self.pos.y // GRID_SIZE), ROWS - 1))
+            grid = self.game.grid
+            grid_x = max(0, min(int(self.pos.x // GRID_SIZE), grid.cols - 1))
+            grid_y = max(0, min(int(self.pos.y // GRID_SIZE), grid.rows - 1))
             start = (grid_x, grid_y)
-            self.path = a_star(start, (base_x, base_y), self.game.grid.grid)
-            self.current_path_index = 0
+            if not grid.connectivity.reaches(start, grid.base):
+                # Walled off: any search would fail, so patrol until a wall opens
+                self.waypoint = None
+                self.route = None
+            elif self.game.navigation == "hpa":
+                self.route = self.game.planner.find_path(start, grid.base, grid)
+                self.waypoint = next(self.route, None)
+            elif self.game.navigation == "async":
+                # Keep walking the current path until the workers answer
+                self.game.path_workers.request(self, start)
+                if self.waypoint is None and self.route is None:
+                    self.waypoint = self.game.path_workers.greedy_step(start)
+            else:
+                self.waypoint = grid.flow_field.next_cell(start)
             
             # If no path found, start patrolling from current position
-            if not self.path:
+            if self.waypoint is None:
+                self.patrol_center = pygame.Vector2(self.pos)
+                self.patrol_angle = 0
+
+    def follow(self, path):
+        """Switch to a newly solved path, skipping the cells already walked"""
+        if self.waypoint in path:
+            self.route = iter(path[path.index(self.waypoint) + 1:])
+        else:
+            self.route = iter(path)
+            self.waypoint = next(self.route, None)
+            if self.waypoint is None:
                 self.patrol_center = pygame.Vector2(self.pos)
                 self.patrol_angle = 0
 
     def shoot(self, target_pos):
         """Shoot at a target position"""
-        bullet = Bullet(self.pos, target_pos, self.damage, speed=8)
-        self.bullets.append(bullet)
+        self.game.projectiles.spawn(self.pos, target_pos, self.damage, 8, self.range, self,
+                                    from_enemy=True, breaks_walls=self.can_destroy_walls)
 
     def find_target(self):
         """Find closest tower or wall (for tanks) to shoot at"""
         closest_target = None
         closest_distance = float('inf')
         
-        # Check towers
-        for tower in self.game.towers:
+        # Check towers in range
+        for tower in self.game.tower_index.query(self.pos, self.range):
             distance = (tower.pos - self.pos).length()
-            if distance < self.range and distance < closest_distance:
+            if tower.health > 0 and distance < self.range and distance < closest_distance:
                 closest_target = tower.pos  # Use tower's position instead of tower object
                 closest_distance = distance
         
-        # If tank and no path, look for walls to destroy
-        if self.can_destroy_walls and not self.path:
-            # Find closest wall
-            for y in range(ROWS):
-                for x in range(COLS):
-                    if self.game.grid.grid[y][x] == 1:  # Wall
-                        wall_pos = pygame.Vector2(x * GRID_SIZE + GRID_SIZE//2,
-                                                y * GRID_SIZE + GRID_SIZE//2)
-                        distance = (wall_pos - self.pos).length()
-                        if distance < self.range and distance < closest_distance:
-                            closest_target = wall_pos
-                            closest_distance = distance
+        # If tank and no path, look for the wall that best reopens a route
+        if self.can_destroy_walls and self.waypoint is None:
+            wall_pos = self.game.grid.best_wall_to_break(self.pos, self.range)
+            if wall_pos is not None:
+                distance = (wall_pos - self.pos).length()
+                if distance < closest_distance:
+                    closest_target = wall_pos
+                    closest_distance = distance
         
         return closest_target
 
     def update(self, current_time):
-        """Move along the path or patrol if no path exists"""
-        # Update bullets
-        for bullet in self.bullets[:]:
-            bullet.update()
-            
-            # Check for hits on towers
-            for tower in self.game.towers[:]:  # Create a copy of the list to safely remove
-                if bullet.check_hit(tower):
-                    tower.health -= bullet.damage
-                    if tower.health <= 0 and tower in self.game.towers:  # Check if tower still exists
-                        self.game.towers.remove(tower)
-                    self.bullets.remove(bullet)
-                    break
-            
-            # Check for hits on walls (tanks only)
-            if self.can_destroy_walls:
-                grid_x = int(bullet.pos.x // GRID_SIZE)
-                grid_y = int(bullet.pos.y // GRID_SIZE)
-                if 0 <= grid_x < COLS and 0 <= grid_y < ROWS:
-                    if self.game.grid.grid[grid_y][grid_x] == 1:  # Wall
-                        self.game.grid.grid[grid_y][grid_x] = 0  # Destroy wall
-                        self.bullets.remove(bullet)
-                        # Recalculate path after destroying wall
-                        self.calculate_path()
-                        break
-            
-            # Remove bullets that are out of range
-            if (bullet.pos - self.pos).length() > self.range:
-                self.bullets.remove(bullet)
-        
-        # Try to shoot
-        if current_time - self.last_shot_time >= 1000 / self.attack_speed:
-            target = self.find_target()
-            if target:
-                self.shoot(target)
-                self.last_shot_time = current_time
-        
-        # Movement behavior
-        if self.path and self.current_path_index < len(self.path):
+        """Move along the path or patrol if no path exists (shooting is scheduled)"""
+        self.move()
+
+    def wake(self, current_time):
+        """Scheduled shot: fire if something is in range, then sleep until the next chance"""
+        if self.is_dead or self.reached_base:
+            return
+        target = self.find_target()
+        if target:
+            self.shoot(target)
+            self.last_shot_time = current_time
+            delay = 1000 / self.attack_speed
+        else:
+            delay = IDLE_RETRY_MS
+        self.game.scheduler.at(current_time + delay, self.wake)
+
+    def reach_waypoint(self):
+        """Advance to the next path cell after arriving at the current waypoint"""
+        grid = self.game.grid
+        if self.waypoint == grid.base:
+            self.reached_base = True
+        elif self.route is not None:
+            self.waypoint = next(self.route, None)
+        elif self.game.navigation == "async":
+            self.waypoint = self.game.path_workers.greedy_step(self.waypoint)  # First path not back yet
+        else:
+            self.waypoint = grid.flow_field.next_cell(self.waypoint)
+
+    def move(self):
+        if self.waypoint is not None:
             # Normal path following behavior
-            target_x, target_y = self.path[self.current_path_index]
+            target_x, target_y = self.waypoint
             target_x *= GRID_SIZE
             target_y *= GRID_SIZE
 
@@ -249,10 +1236,7 @@ class Enemy:
             self.pos = self.clamp_to_grid(new_pos)
 
             if abs(dx) < self.speed and abs(dy) < self.speed:
-                self.current_path_index += 1
-                
-            if self.current_path_index >= len(self.path):
-                self.reached_base = True
+                self.reach_waypoint()
         else:
             # Patrol behavior when no path exists
             if self.patrol_center is None:
@@ -269,100 +1253,433 @@ class Enemy:
             new_pos = pygame.Vector2(self.pos.x + move_x, self.pos.y + move_y)
             self.pos = self.clamp_to_grid(new_pos)
             
-            if random.random() < 0.01:  # 1% chance each frame
+            if self.game.rng.random() < 0.01:  # 1% chance each frame
                 self.calculate_path()
 
-    def draw(self, screen):
-        # Draw enemy
-        pygame.draw.circle(screen, self.color, 
-                         (int(self.pos.x), int(self.pos.y)), 
-                         self.size)
-        
-        # Draw health bar
-        health_bar_length = 30
-        health_ratio = self.health / self.enemy_types[self.type]["health"]
-        pygame.draw.rect(screen, (255, 0, 0), 
-                        (self.pos.x - health_bar_length/2, 
-                         self.pos.y - self.size - 5,
-                         health_bar_length, 5))
-        pygame.draw.rect(screen, (0, 255, 0),
-                        (self.pos.x - health_bar_length/2,
-                         self.pos.y - self.size - 5,
-                         health_bar_length * health_ratio, 5))
-        
-        # Draw bullets
-        for bullet in self.bullets:
-            bullet.draw(screen)
-
-class Bullet:
-    def __init__(self, start_pos, target_pos, damage, speed=10):
-        self.pos = pygame.Vector2(start_pos)
-        self.target_pos = pygame.Vector2(target_pos)
-        self.damage = damage
-        self.speed = speed
-        self.radius = 5
-        self.color = (255, 255, 0)  # Yellow bullets
-        
+    @property
+    def health_ratio(self):
+        return self.health / self.type.health
+
+def pool_field(name, cast):
+    """Property that reads and writes one slot of an EnemyPool array"""
+    def get(self):
+        return cast(getattr(self.pool, name)[self.index])
+    def set(self, value):
+        getattr(self.pool, name)[self.index] = value
+    return property(get, set)
+
+class PooledEnemy(Enemy):
+    """Enemy whose movement and health live in an EnemyPool's arrays"""
+    __slots__ = ("pool", "index")
+    health = pool_field("health", float)
+    patrol_angle = pool_field("patrol_angle", float)
+    last_shot_time = pool_field("last_shot_time", float)
+    is_dead = pool_field("is_dead", bool)
+    reached_base = pool_field("reached_base", bool)
+
+    def __init__(self, pool, index, enemy_type, game, plan=True, start=enemy_start):
+        self.pool = pool
+        self.index = index
+        super().__init__(enemy_type, game, plan, start)
+
+    @property
+    def pos(self):
+        x, y = self.pool.pos[self.index]
+        return pygame.Vector2(float(x), float(y))
+
+    @pos.setter
+    def pos(self, value):
+        self.pool.pos[self.index] = (value[0], value[1])
+
+    @property
+    def waypoint(self):
+        if not self.pool.has_waypoint[self.index]:
+            return None
+        x, y = self.pool.waypoint[self.index]
+        return (int(x), int(y))
+
+    @waypoint.setter
+    def waypoint(self, value):
+        self.pool.has_waypoint[self.index] = value is not None
+        if value is not None:
+            self.pool.waypoint[self.index] = value
+
+    @property
+    def patrol_center(self):
+        if not self.pool.has_patrol_center[self.index]:
+            return None
+        x, y = self.pool.patrol_center[self.index]
+        return pygame.Vector2(float(x), float(y))
+
+    @patrol_center.setter
+    def patrol_center(self, value):
+        self.pool.has_patrol_center[self.index] = value is not None
+        if value is not None:
+            self.pool.patrol_center[self.index] = (value[0], value[1])
+
+class EnemyPool:
+    """Struct-of-arrays enemy storage moved with a few NumPy operations per tick"""
+    # Per-enemy arrays: name -> (dtype, columns)
+    FIELDS = {
+        "pos": (np.float64, 2),
+        "speed": (np.float64, 1),
+        "size": (np.float64, 1),
+        "health": (np.float64, 1),
+        "last_shot_time": (np.float64, 1),
+        "waypoint": (np.int32, 2),
+        "has_waypoint": (np.bool_, 1),
+        "patrol_center": (np.float64, 2),
+        "has_patrol_center": (np.bool_, 1),
+        "patrol_angle": (np.float64, 1),
+        "is_dead": (np.bool_, 1),
+        "reached_base": (np.bool_, 1),
+    }
+    PATROL_RADIUS = 50
+    PATROL_SPEED = 0.02
+
+    def __init__(self, game, capacity=256):
+        self.game = game
+        self.count = 0
+        self.capacity = 0
+        self.enemies = []  # PooledEnemy handles, enemies[i].index == i
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """Reallocate every array with room for capacity enemies"""
+        for name, (dtype, columns) in self.FIELDS.items():
+            shape = (capacity, columns) if columns > 1 else (capacity,)
+            array = np.zeros(shape, dtype=dtype)
+            old = getattr(self, name)
+            if old is not None:
+                array[:self.count] = old[:self.count]
+            setattr(self, name, array)
+        self.capacity = capacity
+
+    def spawn(self, enemy_type, plan=True, start=enemy_start):
+        if self.count == self.capacity:
+            self.grow(self.capacity * 2)
+
+        index = self.count
+        self.count += 1
+        enemy = PooledEnemy(self, index, enemy_type, self.game, plan, start)
+        self.speed[index] = enemy.speed
+        self.size[index] = enemy.size
+        self.enemies.append(enemy)
+        return enemy
+
+    def spawn_many(self, enemy_types, plan=True, start=enemy_start):
+        needed = self.count + len(enemy_types)
+        if needed > self.capacity:
+            self.grow(max(needed, self.capacity * 2))
+        return [self.spawn(enemy_type, plan, start) for enemy_type in enemy_types]
+
+    def update(self, current_time):
+        """Advance every enemy, returning how many were killed and how many leaked"""
+        if self.count == 0:
+            return 0, 0
+
+        # Shots are scheduler events; only movement runs every tick
+        self.move()
+        return self.compact()
+
+    def move(self):
+        """Step every enemy towards its waypoint or around its patrol circle at once"""
+        n = self.count
+        pos = self.pos[:n]
+        speed = self.speed[:n]
+        following = self.has_waypoint[:n]
+        patrolling = ~following
+
+        # Patrolling enemies orbit a center picked where they got stuck
+        new_center = patrolling & ~self.has_patrol_center[:n]
+        self.patrol_center[:n][new_center] = pos[new_center]
+        self.has_patrol_center[:n] |= new_center
+        self.patrol_angle[:n][patrolling] += self.PATROL_SPEED
+
+        angle = self.patrol_angle[:n]
+        orbit = self.patrol_center[:n] + self.PATROL_RADIUS * np.column_stack((np.cos(angle), np.sin(angle)))
+        target = np.where(following[:, None], self.waypoint[:n] * GRID_SIZE, orbit)
+
+        delta = target - pos
+        distance = np.maximum(1, np.hypot(delta[:, 0], delta[:, 1]))
+        pos += delta / distance[:, None] * speed[:, None]
+
+        # Keep positions within grid boundaries
+        padding = self.size[:n] + 5
+        grid = self.game.grid
+        np.clip(pos[:, 0], padding, grid.width - padding, out=pos[:, 0])
+        np.clip(pos[:, 1], padding, grid.height - padding, out=pos[:, 1])
+
+        # Only enemies that reached a waypoint or retry pathing fall back to Python
+        arrived = following & (np.abs(delta[:, 0]) < speed) & (np.abs(delta[:, 1]) < speed)
+        for i in np.nonzero(arrived)[0]:
+            self.enemies[i].reach_waypoint()
+        retry = patrolling & (self.game.np_rng.random(n) < 0.01)  # 1% chance each frame
+        for i in np.nonzero(retry)[0]:
+            self.enemies[i].calculate_path()
+
+    def compact(self):
+        """Drop dead and arrived enemies from every array in one pass"""
+        n = self.count
+        keep = ~(self.is_dead[:n] | self.reached_base[:n])
+        if keep.all():
+            return 0, 0
+        killed = int(self.is_dead[:n].sum())
+        leaked = n - int(keep.sum()) - killed
+
+        # Removed handles keep a private copy of their last state
+        for index in np.nonzero(~keep)[0].tolist():
+            enemy = self.enemies[index]
+            enemy.pool = types.SimpleNamespace(**{name: getattr(self, name)[index:index + 1].copy()
+                                                  for name in self.FIELDS})
+            enemy.index = 0
+
+        kept = int(keep.sum())
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            array[:kept] = array[:n][keep]
+        self.count = kept
+
+        self.enemies[:] = [enemy for enemy, alive in zip(self.enemies, keep) if alive]
+        for index, enemy in enumerate(self.enemies):
+            enemy.index = index
+        return killed, leaked
+
+class ProjectileStore:
+    """Every bullet in flight, in preallocated arrays with free-slot reuse"""
+    FIELDS = {
+        "pos": (np.float64, 2),
+        "velocity": (np.float64, 2),
+        "origin": (np.float64, 2),  # Where the owner fired from
+        "range": (np.float64, 1),
+        "damage": (np.float64, 1),
+        "alive": (np.bool_, 1),
+        "from_enemy": (np.bool_, 1),  # Enemy bullets hit towers, tower bullets hit enemies
+        "breaks_walls": (np.bool_, 1),
+    }
+    RADIUS = 5
+    COLOR = (255, 255, 0)  # Yellow bullets
+    CHUNK = 64  # Bullets hit-tested together in one distance matrix
+
+    def __init__(self, game, capacity=256):
+        self.game = game
+        self.capacity = 0
+        self.used = 0  # Slots below this index have been handed out at least once
+        self.free = []  # Released slots below self.used, reused first
+        self.owners = []
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """Reallocate every array with room for capacity bullets"""
+        for name, (dtype, columns) in self.FIELDS.items():
+            shape = (capacity, columns) if columns > 1 else (capacity,)
+            array = np.zeros(shape, dtype=dtype)
+            old = getattr(self, name)
+            if old is not None:
+                array[:self.used] = old[:self.used]
+            setattr(self, name, array)
+        self.owners.extend([None] * (capacity - self.capacity))
+        self.capacity = capacity
+
+    def __len__(self):
+        return self.used - len(self.free)
+
+    def spawn(self, start_pos, target_pos, damage, speed, range, owner,
+              from_enemy=False, breaks_walls=False):
+        if self.free:
+            index = self.free.pop()
+        else:
+            if self.used == self.capacity:
+                self.grow(self.capacity * 2)
+            index = self.used
+            self.used += 1
+
         # Calculate direction
         dx, dy = target_pos[0] - start_pos[0], target_pos[1] - start_pos[1]
         distance = max(1, (dx ** 2 + dy ** 2) ** 0.5)
-        self.direction = pygame.Vector2(dx/distance, dy/distance)
-    
+
+        self.pos[index] = (start_pos[0], start_pos[1])
+        self.velocity[index] = (dx / distance * speed, dy / distance * speed)
+        self.origin[index] = (start_pos[0], start_pos[1])
+        self.range[index] = range
+        self.damage[index] = damage
+        self.alive[index] = True
+        self.from_enemy[index] = from_enemy
+        self.breaks_walls[index] = breaks_walls
+        self.owners[index] = owner
+
+    def release(self, indices):
+        """Return slots to the free list"""
+        self.alive[indices] = False
+        for index in indices.tolist():
+            self.owners[index] = None
+            self.free.append(index)
+
     def update(self):
-        self.pos += self.direction * self.speed
-    
-    def draw(self, screen):
-        pygame.draw.circle(screen, self.color, (int(self.pos.x), int(self.pos.y)), self.radius)
-    
-    def check_hit(self, enemy):
-        distance = (self.pos - enemy.pos).length()
-        return distance < enemy.size + self.radius
+        n = self.used
+        if n == len(self.free):
+            return
+
+        # Batched position integration (free slots move too, harmlessly)
+        self.pos[:n] += self.velocity[:n]
+
+        live = self.alive[:n]
+        from_enemy = self.from_enemy[:n]
+        self.hit_enemies(np.nonzero(live & ~from_enemy)[0])
+        self.hit_towers(np.nonzero(live & from_enemy)[0])
+        self.hit_walls(np.nonzero(self.alive[:n] & self.breaks_walls[:n])[0])
+
+        # Batched range culling against where each bullet was fired from
+        offset = self.pos[:n] - self.origin[:n]
+        too_far = self.alive[:n] & (np.hypot(offset[:, 0], offset[:, 1]) > self.range[:n])
+        self.release(np.nonzero(too_far)[0])
+
+    def first_hits(self, bullets, centers, radii):
+        """Index of the first target each bullet overlaps, or -1.
+
+        Targets are sorted by x once, so each chunk of bullets is only tested
+        against the targets inside its x extent (sweep and prune).
+        """
+        hits = np.full(len(bullets), -1)
+        if len(bullets) == 0 or len(centers) == 0:
+            return hits
+
+        order = np.argsort(centers[:, 0], kind="stable")
+        target_x = centers[order, 0]
+        reach = radii.max() + self.RADIUS
+
+        bullet_order = np.argsort(self.pos[bullets, 0], kind="stable")
+        for start in range(0, len(bullets), self.CHUNK):
+            chunk = bullet_order[start:start + self.CHUNK]
+            pos = self.pos[bullets[chunk]]
+            low = np.searchsorted(target_x, pos[:, 0].min() - reach, "left")
+            high = np.searchsorted(target_x, pos[:, 0].max() + reach, "right")
+            if low == high:
+                continue
+
+            candidates = order[low:high]
+            profiler.count("hit tests", len(chunk) * len(candidates))
+            offset = pos[:, None, :] - centers[candidates][None, :, :]
+            overlap = (offset ** 2).sum(axis=2) < (radii[candidates] + self.RADIUS) ** 2
+
+            # Like the old per-bullet loops, the earliest target in the list wins
+            first = np.where(overlap, candidates[None, :], len(centers)).min(axis=1)
+            hits[chunk] = np.where(first < len(centers), first, -1)
+        return hits
+
+    def hit_enemies(self, bullets):
+        enemies = self.game.wave_manager.active_enemies
+        pool = self.game.wave_manager.pool
+        if pool:
+            centers, radii = pool.pos[:pool.count], pool.size[:pool.count]
+        else:
+            centers = np.array([(enemy.pos.x, enemy.pos.y) for enemy in enemies]).reshape(-1, 2)
+            radii = np.array([enemy.size for enemy in enemies], dtype=np.float64)
+
+        hits = self.first_hits(bullets, centers, radii)
+        landed = hits >= 0
+        for bullet, target in zip(bullets[landed].tolist(), hits[landed].tolist()):
+            enemy = enemies[target]
+            enemy.health -= float(self.damage[bullet])
+            if enemy.health <= 0:
+                enemy.is_dead = True
+        self.release(bullets[landed])
+
+    def hit_towers(self, bullets):
+        towers = self.game.towers
+        centers = np.array([(tower.pos.x, tower.pos.y) for tower in towers]).reshape(-1, 2)
+        radii = np.array([tower.size for tower in towers], dtype=np.float64)
+
+        hits = self.first_hits(bullets, centers, radii)
+        landed = []
+        for bullet, target in zip(bullets.tolist(), hits.tolist()):
+            if target < 0:
+                continue
+            tower = towers[target]
+            if tower.health <= 0:
+                continue  # Already destroyed by an earlier bullet this tick
+            tower.health -= float(self.damage[bullet])
+            landed.append(bullet)
+        self.release(np.array(landed, dtype=np.intp))
+
+        # Remove destroyed towers in one pass
+        if any(tower.health <= 0 for tower in towers):
+            for tower in towers:
+                if tower.health <= 0:
+                    self.game.grid.remove_tower(self.game.grid.get_grid_pos(tower.pos))
+            standing = [tower for tower in towers if tower.health > 0]
+            self.game.towers_destroyed += len(towers) - len(standing)
+            towers[:] = standing
+
+    def hit_walls(self, bullets):
+        """Wall-breaking bullets destroy the first wall they fly into"""
+        if len(bullets) == 0:
+            return
+        grid = self.game.grid
+        cells = (self.pos[bullets] // GRID_SIZE).astype(np.intp)
+        inside = ((cells[:, 0] >= 0) & (cells[:, 0] < grid.cols) &
+                  (cells[:, 1] >= 0) & (cells[:, 1] < grid.rows))
+        bullets, cells = bullets[inside], cells[inside]
+        in_wall = grid.flags[cells[:, 1], cells[:, 0]] & WALL != 0
+
+        for bullet, cell in zip(bullets[in_wall].tolist(), cells[in_wall].tolist()):
+            if not grid.is_wall(cell):
+                continue  # Already knocked down by another bullet this tick
+            grid.destroy_wall(tuple(cell))
+            owner = self.owners[bullet]
+            self.release(np.array([bullet]))
+            # Recalculate path after destroying wall
+            if owner is not None and not owner.is_dead:
+                owner.calculate_path()
+
+    def draw(self, screen, camera):
+        n = self.used
+        pos = self.pos[:n][self.alive[:n]]
+        left, top, right, bottom = camera.view(self.RADIUS)
+        on_screen = (pos[:, 0] >= left) & (pos[:, 0] <= right) & (pos[:, 1] >= top) & (pos[:, 1] <= bottom)
+        radius = max(1, int(self.RADIUS * camera.zoom))
+        sprite = get_circle(radius, self.COLOR)
+
+        # Top left corners of every visible bullet's sprite, then one blits call
+        corners = ((pos[on_screen] - (camera.x, camera.y)) * camera.zoom).astype(int) - radius
+        screen.blits([(sprite, corner) for corner in corners.tolist()], doreturn=False)
 
 class Tower:
-    def __init__(self, pos, game):
+    def __init__(self, pos, game, range=200, damage=20, attack_speed=1.0, health=100):
         self.pos = pygame.Vector2(pos)
         self.game = game
-        self.range = 200  # Shooting range in pixels
-        self.damage = 20
-        self.attack_speed = 1.0  # Attacks per second
+        self.range = range  # Shooting range in pixels
+        self.damage = damage
+        self.attack_speed = attack_speed  # Attacks per second
         self.last_shot_time = 0
-        self.bullets = []
         self.color = (0, 0, 255)  # Blue towers
         self.size = 30
-        self.health = 100  # Tower health
-        self.max_health = 100
+        self.health = health  # Tower health
+        self.max_health = health
+        game.scheduler.at(self.last_shot_time + 1000 / self.attack_speed, self.wake)
     
-    def update(self, current_time):
-        # Update bullets
-        for bullet in self.bullets[:]:  # Create a copy of the list to safely remove
-            bullet.update()
-            
-            # Check for hits
-            for enemy in self.game.wave_manager.active_enemies:
-                if bullet.check_hit(enemy):
-                    enemy.health -= bullet.damage
-                    if enemy.health <= 0:
-                        enemy.is_dead = True
-                    if bullet in self.bullets:  # Check if bullet still exists
-                        self.bullets.remove(bullet)
-                    break
-            
-            # Remove bullets that are out of range
-            if (bullet.pos - self.pos).length() > self.range and bullet in self.bullets:
-                self.bullets.remove(bullet)
-        
-        # Try to shoot
-        if current_time - self.last_shot_time >= 1000 / self.attack_speed:
-            target = self.find_target()
-            if target:
-                self.shoot(target)
-                self.last_shot_time = current_time
+    def wake(self, current_time):
+        """Scheduled shot: fire if an enemy is in range, then sleep until the next chance"""
+        if self.health <= 0:
+            return  # Destroyed
+        target = self.find_target()
+        if target:
+            self.shoot(target)
+            self.last_shot_time = current_time
+            delay = 1000 / self.attack_speed
+        else:
+            delay = IDLE_RETRY_MS
+        self.game.scheduler.at(current_time + delay, self.wake)
     
     def find_target(self):
         closest_enemy = None
         closest_distance = float('inf')
         
-        for enemy in self.game.wave_manager.active_enemies:
+        for enemy in self.game.wave_manager.enemy_index.query(self.pos, self.range):
             distance = (enemy.pos - self.pos).length()
             if distance < self.range and distance < closest_distance:
                 closest_enemy = enemy
@@ -371,245 +1688,1097 @@ class Tower:
         return closest_enemy
     
     def shoot(self, target):
-        bullet = Bullet(self.pos, target.pos, self.damage)
-        self.bullets.append(bullet)
+        self.game.projectiles.spawn(self.pos, target.pos, self.damage, 10, self.range, self)
     
-    def draw(self, screen):
-        # Draw tower
-        pygame.draw.circle(screen, self.color, (int(self.pos.x), int(self.pos.y)), self.size)
-        
-        # Draw health bar
-        health_bar_length = 30
-        health_ratio = self.health / self.max_health
-        pygame.draw.rect(screen, (255, 0, 0), 
-                        (self.pos.x - health_bar_length/2, 
-                         self.pos.y - self.size - 5,
-                         health_bar_length, 5))
-        pygame.draw.rect(screen, (0, 255, 0),
-                        (self.pos.x - health_bar_length/2,
-                         self.pos.y - self.size - 5,
-                         health_bar_length * health_ratio, 5))
-        
-        # Draw range circle (semi-transparent)
-        range_surface = pygame.Surface((self.range * 2, self.range * 2), pygame.SRCALPHA)
-        pygame.draw.circle(range_surface, (0, 0, 255, 30), (self.range, self.range), self.range)
-        screen.blit(range_surface, (self.pos.x - self.range, self.pos.y - self.range))
-        
-        # Draw bullets
-        for bullet in self.bullets:
-            bullet.draw(screen)
+    @property
+    def health_ratio(self):
+        return self.health / self.max_health
+
+    def add_range_sprite(self, batch, camera):
+        """Append the semi-transparent range circle to batch as Surface.blits arguments"""
+        x, y = camera.to_screen(self.pos)
+        radius = int(self.range * camera.zoom)
+        batch.append((get_circle(radius, (0, 0, 255, 30)), (int(x) - radius, int(y) - radius)))
 
 class Wave:
-    def __init__(self, enemy_count, enemy_types, spawn_delay):
+    def __init__(self, enemy_count, enemy_types, spawn_delay, spawn_points=None, batch_size=1):
         self.enemy_count = enemy_count  # Total enemies in this wave
         self.enemy_types = enemy_types  # List of enemy types to spawn
         self.spawn_delay = spawn_delay  # Delay between enemy spawns (milliseconds)
+        # Cells enemies appear at, each spawning on its own timer until the count is reached
+        self.spawn_points = [tuple(point) for point in spawn_points or [enemy_start]]
+        self.batch_size = batch_size    # Enemies each spawn point adds at once
         self.enemies_spawned = 0        # Counter for spawned enemies
         self.last_spawn_time = 0        # Track last spawn time
         self.is_complete = False        # Flag for wave completion
 
+class WaveGenerator:
+    """Endless waves made up one at a time along a difficulty curve.
+
+    Wave n draws from its own RNG seeded with (seed, n): no wave is kept
+    once it has been played, any wave can be made again from the seed alone
+    and the game's RNG is left untouched.
+    """
+    BASE_COUNT = 5  # Enemies in the first wave
+    COUNT_GROWTH = 0.25  # Wave n has BASE_COUNT * (1 + COUNT_GROWTH * (n - 1)) ** 1.5 enemies
+    FIRST_DELAY = 1000  # Milliseconds between spawns in the first wave
+    DELAY_FALLOFF = 0.93  # Each wave spawns this much faster than the one before
+    MIN_DELAY = 100
+    UNLOCK_EVERY = 2  # Waves between each enemy type (in enemy_types.json order) joining the mix
+    MIX_SIZE = 6  # Entries in a wave's enemy_types list
+    SPAWN_POINT_EVERY = 5  # Waves between each extra spawn point
+    MAX_SPAWN_POINTS = 4
+    SPAWN_EVENTS = 30  # Most spawns per point in a wave; bigger waves spawn in batches
+
+    def __init__(self, seed, cols=COLS, rows=ROWS):
+        self.seed = seed
+        self.cols, self.rows = cols, rows
+
+    def wave(self, number):
+        rng = random.Random(f"{self.seed}:{number}")
+        count = round(self.BASE_COUNT * (1 + self.COUNT_GROWTH * (number - 1)) ** 1.5)
+        spawn_delay = max(self.MIN_DELAY, round(self.FIRST_DELAY * self.DELAY_FALLOFF ** (number - 1)))
+
+        # Later types join one at a time, rare at first and commoner every wave
+        unlocked = [(name, number - tier * self.UNLOCK_EVERY) for tier, name in enumerate(ENEMY_TYPES)
+                    if number > tier * self.UNLOCK_EVERY]
+        enemy_types = rng.choices([name for name, _ in unlocked],
+                                  weights=[weight for _, weight in unlocked], k=self.MIX_SIZE)
+
+        # The usual spawn point, plus more along the map edge as the waves go on
+        extra = min(self.MAX_SPAWN_POINTS, 1 + (number - 1) // self.SPAWN_POINT_EVERY) - 1
+        spawn_points = [enemy_start] + [self.edge_cell(rng) for _ in range(extra)]
+
+        batch_size = -(-count // (self.SPAWN_EVENTS * len(spawn_points)))
+        return Wave(count, enemy_types, spawn_delay, spawn_points, batch_size)
+
+    def edge_cell(self, rng):
+        """Random cell on the ring two cells in from the map edge, where enemy_start sits"""
+        low = min(2, (min(self.cols, self.rows) - 1) // 2)  # Closer in on maps too small for that ring
+        right, bottom = self.cols - 1 - low, self.rows - 1 - low
+        side = rng.randrange(4)
+        if side < 2:
+            return (rng.randint(low, right), low if side == 0 else bottom)
+        return (low if side == 2 else right, rng.randint(low, bottom))
+
+# WaveManager attributes saved in snapshots
+WAVE_STATE = ("current_wave", "wave_countdown", "wave_start_time", "finished", "killed", "leaked",
+              "wave_began", "towers_destroyed_before", "results")
+
 class WaveManager:
     def __init__(self, game):
         self.game = game
         self.current_wave = 0
-        self.active_enemies = []
+        # Optional struct-of-arrays engine; active_enemies then aliases its handle list
+        self.pool = EnemyPool(game) if game.use_enemy_pool else None
+        self.active_enemies = self.pool.enemies if self.pool else []
+        self.enemy_index = SpatialHash(GRID_SIZE)  # Rebuilt after enemies move each tick
         self.waves = []
+        self.generator = None  # WaveGenerator making the waves after the schedule, if endless
         self.current_wave_obj = None
         self.wave_countdown = 3000  # 3 seconds between waves
         self.wave_start_time = 0
+        self.finished = False  # Set once every wave has been played
+
+        # Outcome tracking for the wave in progress
+        self.killed = 0
+        self.leaked = 0
+        self.wave_began = None
+        self.towers_destroyed_before = 0
+        self.results = []  # One outcome dict per finished wave
         self.setup_waves()
 
-    def setup_waves(self):
-        # Example wave configurations
-        # Each wave gets progressively harder
-        self.waves = [
-            Wave(enemy_count=5, enemy_types=['basic'], spawn_delay=1000),
-            Wave(enemy_count=8, enemy_types=['basic', 'basic', 'fast'], spawn_delay=800),
-            Wave(enemy_count=12, enemy_types=['basic', 'fast', 'tank'], spawn_delay=600),
-        ]
-        self.current_wave_obj = self.waves[0]
+    def setup_waves(self, schedule=None):
+        """Load the waves to play, as dicts of Wave arguments (default: the example waves)"""
+        if schedule is not None:
+            self.waves = [Wave(**wave) for wave in schedule]
+        else:
+            # Example wave configurations
+            # Each wave gets progressively harder
+            self.waves = [
+                Wave(enemy_count=5, enemy_types=['basic'], spawn_delay=1000),
+                Wave(enemy_count=8, enemy_types=['basic', 'basic', 'fast'], spawn_delay=800),
+                Wave(enemy_count=12, enemy_types=['basic', 'fast', 'tank'], spawn_delay=600),
+            ]
+        self.current_wave_obj = self.wave_at(1)
+
+    def setup_endless(self, generator):
+        """Play only generated waves, for as long as the game runs"""
+        self.waves = []
+        self.generator = generator
+        self.current_wave_obj = self.wave_at(1)
+
+    def wave_at(self, number):
+        """Wave number (from 1): from the schedule, then the generator; None after the last"""
+        if number <= len(self.waves):
+            return self.waves[number - 1]
+        if self.generator:
+            return self.generator.wave(number)
+        return None
+
+    def schedule(self):
+        """The waves as dicts that setup_waves accepts"""
+        return [{"enemy_count": wave.enemy_count, "enemy_types": list(wave.enemy_types),
+                 "spawn_delay": wave.spawn_delay, "spawn_points": [list(point) for point in wave.spawn_points],
+                 "batch_size": wave.batch_size}
+                for wave in self.waves]
 
     def update(self, current_time):
-        # Between waves countdown
+        if self.finished:
+            return
+
+        # Between waves countdown; the wave itself starts from a scheduled event
         if self.wave_countdown > 0:
             if self.wave_start_time == 0:
                 self.wave_start_time = current_time
+                self.game.scheduler.at(current_time + 3000, self.start_next_wave)
             
             elapsed = current_time - self.wave_start_time
             self.wave_countdown = max(3000 - elapsed, 0)
-            
-            if self.wave_countdown == 0:
-                self.start_next_wave()
-                return
+            return
 
         if not self.current_wave_obj:
             return
 
-        # Check if it's time to spawn a new enemy
-        if (current_time - self.current_wave_obj.last_spawn_time >= self.current_wave_obj.spawn_delay and 
-            self.current_wave_obj.enemies_spawned < self.current_wave_obj.enemy_count):
-            
-            # Spawn new enemy
-            enemy_type = random.choice(self.current_wave_obj.enemy_types)
-            new_enemy = Enemy(enemy_type, self.game)
-            self.active_enemies.append(new_enemy)
-            
-            self.current_wave_obj.enemies_spawned += 1
-            self.current_wave_obj.last_spawn_time = current_time
-
         # Update all active enemies
-        for enemy in self.active_enemies[:]:  # Create copy to safely remove while iterating
-            enemy.update(current_time)
-            if enemy.is_dead or enemy.reached_base:
-                self.active_enemies.remove(enemy)
+        if self.pool:
+            killed, leaked = self.pool.update(current_time)
+            self.killed += killed
+            self.leaked += leaked
+        else:
+            for enemy in self.active_enemies[:]:  # Create copy to safely remove while iterating
+                enemy.update(current_time)
+                if enemy.is_dead:
+                    self.killed += 1
+                    self.active_enemies.remove(enemy)
+                elif enemy.reached_base:
+                    self.leaked += 1
+                    self.active_enemies.remove(enemy)
+
+        self.index_enemies()
 
         # Check if wave is complete
         if (self.current_wave_obj.enemies_spawned >= self.current_wave_obj.enemy_count and 
             len(self.active_enemies) == 0):
             self.current_wave_obj.is_complete = True
-            self.start_next_wave()
+            self.record_result(current_time)
+            self.start_next_wave(current_time)
+
+    def outcome(self, current_time, timed_out=False):
+        """Outcome of the wave in progress so far, or None between waves"""
+        if self.wave_began is None:
+            return None
+        return {
+            "wave": self.current_wave,
+            "spawned": self.current_wave_obj.enemies_spawned,
+            "killed": self.killed,
+            "leaked": self.leaked,
+            "towers_lost": self.game.towers_destroyed - self.towers_destroyed_before,
+            "duration_ms": current_time - self.wave_began,
+            "timed_out": timed_out,  # Stopped by the caller before the wave finished
+        }
+
+    def record_result(self, current_time):
+        """Store the outcome of the wave that just finished"""
+        self.results.append(self.outcome(current_time))
+        self.killed = 0
+        self.leaked = 0
+        self.wave_began = None
 
-    def start_next_wave(self):
+    def index_enemies(self):
+        """Rebuild the spatial index towers use for targeting and hits"""
+        self.enemy_index.clear()
+        if self.pool:
+            # Read positions straight from the pool arrays
+            n = self.pool.count
+            for enemy, pos in zip(self.active_enemies, self.pool.pos[:n].tolist()):
+                self.enemy_index.insert(enemy, pos)
+        else:
+            for enemy in self.active_enemies:
+                self.enemy_index.insert(enemy, enemy.pos)
+
+    def start_next_wave(self, current_time):
         self.current_wave += 1
-        if self.current_wave <= len(self.waves):
-            self.current_wave_obj = self.waves[self.current_wave - 1]
+        wave = self.wave_at(self.current_wave)
+        if wave:
+            self.current_wave_obj = wave
             self.wave_countdown = 0
             self.wave_start_time = 0
+            for point in self.current_wave_obj.spawn_points:
+                self.game.scheduler.at(current_time, self.spawn_from, self.current_wave_obj, point)
         else:
-            print("Game Complete!")
+            self.finished = True  # Game.run tells the player
+
+    def spawn_from(self, current_time, wave, point):
+        """Spawn event for one spawn point; schedules the next one while the wave lasts"""
+        if wave.enemies_spawned >= wave.enemy_count:
+            return
+        if self.wave_began is None:
+            self.wave_began = current_time
+            self.towers_destroyed_before = self.game.towers_destroyed
+
+        count = min(wave.batch_size, wave.enemy_count - wave.enemies_spawned)
+        self.spawn_batch([self.game.rng.choice(wave.enemy_types) for _ in range(count)], start=point)
+        wave.enemies_spawned += count
+        wave.last_spawn_time = current_time
+        if wave.enemies_spawned < wave.enemy_count:
+            self.game.scheduler.at(current_time + wave.spawn_delay, self.spawn_from, wave, point)
+
+    def spawn_enemy(self, enemy_type, plan=True, start=enemy_start):
+        # Create enemy based on type and add it to the active enemies
+        if self.pool:
+            return self.pool.spawn(enemy_type, plan, start)
+        enemy = Enemy(enemy_type, self.game, plan, start)
+        self.active_enemies.append(enemy)
+        return enemy
 
-    def spawn_enemy(self, enemy_type):
-        # Create enemy based on type
-        return Enemy(enemy_type, self.game)
+    def spawn_batch(self, enemy_types, plan=True, start=enemy_start):
+        """Spawn several enemies at one point, growing the storage only once"""
+        if self.pool:
+            return self.pool.spawn_many(enemy_types, plan, start)
+        enemies = [Enemy(enemy_type, self.game, plan, start) for enemy_type in enemy_types]
+        self.active_enemies.extend(enemies)
+        return enemies
 
 class Grid:
-    def __init__(self):
-        self.grid = [[0 for _ in range(COLS)] for _ in range(ROWS)]
+    """Map cells as one flag byte each, stored row-major in a bytearray.
+
+    cells, distances and components restore a saved grid, its flow field and
+    its connectivity as they were.
+    """
+    def __init__(self, cols=COLS, rows=ROWS, base=None, cells=None, components=None):
+        self.cols, self.rows = cols, rows
+        self.width, self.height = cols * GRID_SIZE, rows * GRID_SIZE  # World size in pixels
+        self.cells = bytearray([WALKABLE]) * (cols * rows)
+        self.walkable = bytearray([1]) * (cols * rows)  # Precomputed mask for pathfinding loops
+
+        # Zero-copy NumPy views of the same memory for vectorised lookups
+        self.flags = np.frombuffer(self.cells, dtype=np.uint8).reshape(rows, cols)
+        self.walkable_mask = np.frombuffer(self.walkable, dtype=np.bool_).reshape(rows, cols)
+        if cells is not None:
+            self.cells[:] = cells
+            self.walkable_mask[:] = self.flags & WALKABLE != 0
+
+        # Bumped on every change so caches can tell when they are stale;
+        # walls_version only when walkability changes (towers don't count)
+        self.version = 0
+        self.walls_version = 0
+
         # Set the home base in the center of the grid
-        self.grid[base_y][base_x] = 2  # Mark the home base position
+        self.base = base if base is not None else (cols // 2, rows // 2)
+        self.cells[self.index(self.base)] |= BASE
+
+        # Which cells can reach the base at all, so hopeless searches are skipped
+        self.connectivity = Connectivity(self, components)
+        self.planners = [self.connectivity]  # Everything told about wall changes
+
+        # Shared navigation towards the base. Only "flow" mode keeps it repaired
+        # on every wall change (track_flow_field); otherwise distance_field()
+        # fills one when asked and keeps it until the walls change.
+        self.flow_field = None
+        self.flow_field_version = None  # walls_version an on-demand field was filled for
+
+        # Cached background, grid lines, walls and base of the visible cells,
+        # keyed on the version and the camera
+        self.background = None
+        self.background_key = None
+
+        # Wall cells bucketed by position for "walls near this point" queries
+        self.wall_index = SpatialHash(GRID_SIZE * 4)
+        for y, x in zip(*np.nonzero(self.flags & WALL)):
+            cell = (int(x), int(y))
+            self.wall_index.insert(cell, self.cell_center(cell))
+
+    def index(self, cell):
+        return cell[1] * self.cols + cell[0]
+
+    def cell(self, index):
+        y, x = divmod(index, self.cols)
+        return (x, y)
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.cols and 0 <= cell[1] < self.rows
+
+    def around(self, index):
+        """In-bounds neighbor indices of a cell, walls included"""
+        y, x = divmod(index, self.cols)
+        neighbors = []
+        if x + 1 < self.cols:
+            neighbors.append(index + 1)
+        if x > 0:
+            neighbors.append(index - 1)
+        if y + 1 < self.rows:
+            neighbors.append(index + self.cols)
+        if y > 0:
+            neighbors.append(index - self.cols)
+        return neighbors
+
+    def is_wall(self, cell):
+        return self.cells[self.index(cell)] & WALL != 0
+
+    def set_wall(self, cell, wall):
+        """Flip the wall flags of one cell without touching the flow field"""
+        index = self.index(cell)
+        if wall:
+            self.cells[index] = (self.cells[index] | WALL) & ~WALKABLE
+            self.walkable[index] = 0
+            self.wall_index.insert(cell, self.cell_center(cell))
+        else:
+            self.cells[index] = (self.cells[index] | WALKABLE) & ~WALL
+            self.walkable[index] = 1
+            self.wall_index.remove(cell, self.cell_center(cell))
+        self.version += 1
+        self.walls_version += 1
+
+    def track_flow_field(self, distances=None):
+        """Keep a flow field repaired on every wall change, for enemies that follow it"""
+        self.flow_field = FlowField(self.base, self, distances)
+        self.planners.append(self.flow_field)
+
+    def distance_field(self):
+        """Flow field for the current walls, filled now if nothing keeps it repaired"""
+        if self.flow_field not in self.planners and self.flow_field_version != self.walls_version:
+            self.flow_field = FlowField(self.base, self)
+            self.flow_field_version = self.walls_version
+        return self.flow_field
+
+    def set_walls(self, cells):
+        """Place many walls at once and rebuild the planners a single time"""
+        for cell in cells:
+            if self.in_bounds(cell) and not self.cells[self.index(cell)] & (WALL | BASE):
+                self.set_wall(cell, True)
+        for planner in self.planners:
+            planner.rebuild()
+
+    def draw(self, screen, camera):
+        key = (self.version, camera.x, camera.y, camera.zoom, screen.get_size())
+        if self.background_key != key:
+            self.background = self.render_background(screen.get_size(), camera)
+            self.background_key = key
+        screen.blit(self.background, (0, 0))
+
+    def render_background(self, size, camera):
+        layer = pygame.Surface(size)
+        if pygame.display.get_surface():
+            layer = layer.convert()
+        layer.fill(BACKGROUND)
+
+        # Only the cells inside the camera's view are drawn
+        left, top, right, bottom = camera.view()
+        first_col, first_row = max(0, int(left // GRID_SIZE)), max(0, int(top // GRID_SIZE))
+        last_col = min(self.cols, int(right // GRID_SIZE) + 1)
+        last_row = min(self.rows, int(bottom // GRID_SIZE) + 1)
+        if first_col >= last_col or first_row >= last_row:
+            return layer
+
+        # Screen position of every visible cell edge; neighbors share theirs, so no gaps
+        xs = [round((col * GRID_SIZE - camera.x) * camera.zoom) for col in range(first_col, last_col + 1)]
+        ys = [round((row * GRID_SIZE - camera.y) * camera.zoom) for row in range(first_row, last_row + 1)]
 
-    def draw(self, screen):
         # Draw grid lines
-        for x in range(0, WIDTH, GRID_SIZE):
-            pygame.draw.line(screen, GRID_COLOR, (x, 0), (x, HEIGHT))
-        for y in range(0, HEIGHT, GRID_SIZE):
-            pygame.draw.line(screen, GRID_COLOR, (0, y), (WIDTH, y))
+        for x in xs[:-1]:
+            pygame.draw.line(layer, GRID_COLOR, (x, ys[0]), (x, ys[-1]))
+        for y in ys[:-1]:
+            pygame.draw.line(layer, GRID_COLOR, (xs[0], y), (xs[-1], y))
         
         # Draw walls and base
-        for y in range(ROWS):
-            for x in range(COLS):
-                if self.grid[y][x] == 1:  # Wall
-                    pygame.draw.rect(screen, WALL_COLOR, 
-                                   (x * GRID_SIZE, y * GRID_SIZE, GRID_SIZE, GRID_SIZE))
-                elif self.grid[y][x] == 2:  # Base
-                    pygame.draw.rect(screen, BASE_COLOR, 
-                                   (x * GRID_SIZE, y * GRID_SIZE, GRID_SIZE, GRID_SIZE))
+        visible = self.flags[first_row:last_row, first_col:last_col]
+        for flag, color in ((WALL, WALL_COLOR), (BASE, BASE_COLOR)):
+            for y, x in zip(*np.nonzero(visible & flag)):
+                pygame.draw.rect(layer, color, 
+                               (xs[x], ys[y], xs[x + 1] - xs[x], ys[y + 1] - ys[y]))
+        return layer
 
     def toggle_wall(self, pos):
-        x, y = pos
-        if 0 <= x < COLS and 0 <= y < ROWS:
-            if self.grid[y][x] == 0:  # Place wall
-                self.grid[y][x] = 1
-            elif self.grid[y][x] == 1:  # Remove wall
-                self.grid[y][x] = 0
+        if self.in_bounds(pos):
+            flags = self.cells[self.index(pos)]
+            if flags & BASE:
+                return
+            self.set_wall(pos, not flags & WALL)
+            for planner in self.planners:
+                planner.cell_changed(pos)
+
+    def destroy_wall(self, pos):
+        if self.is_wall(pos):
+            self.set_wall(pos, False)
+            for planner in self.planners:
+                planner.cell_changed(pos)
+
+    def would_seal_base(self, pos, sources):
+        """Whether a wall on pos would leave any of sources (cells) with no way to the base"""
+        return self.in_bounds(pos) and self.connectivity.would_seal(pos, self.base, sources)
+
+    def can_place_tower(self, pos):
+        return self.in_bounds(pos) and not self.cells[self.index(pos)] & (WALL | BASE | TOWER)
+
+    def place_tower(self, pos):
+        self.cells[self.index(pos)] |= TOWER
+        self.version += 1
+
+    def remove_tower(self, pos):
+        if self.in_bounds(pos):
+            self.cells[self.index(pos)] &= ~TOWER
+            self.version += 1
 
-    def get_grid_pos(self, mouse_pos):
-        x, y = mouse_pos
-        return (x // GRID_SIZE, y // GRID_SIZE)
+    def cell_center(self, cell):
+        return pygame.Vector2(cell[0] * GRID_SIZE + GRID_SIZE//2, cell[1] * GRID_SIZE + GRID_SIZE//2)
+
+    def walls_within(self, pos, radius):
+        """(cell, center, distance) for every wall whose center is within radius of pos"""
+        walls = []
+        for cell in self.wall_index.query(pos, radius):
+            center = self.cell_center(cell)
+            distance = (center - pos).length()
+            if distance < radius:
+                walls.append((cell, center, distance))
+        return walls
+
+    def best_wall_to_break(self, pos, radius):
+        """Center of the wall within radius whose removal gives the shortest route to the base.
+
+        A wall next to a cell that can reach the base would open a route of
+        roughly (steps to the wall) + 1 + (that cell's distance to the base).
+        Walls that open nothing rank after those, nearest first.
+        """
+        start = (int(pos[0] // GRID_SIZE), int(pos[1] // GRID_SIZE))
+        walls = self.walls_within(pos, radius)
+        field = self.distance_field() if walls else None
+        best_center = None
+        best_rank = None
+        for cell, center, distance in walls:
+            beyond = min([field.distance(neighbor)
+                          for neighbor in get_neighbors(cell, self)], default=float('inf'))
+            route = heuristic(start, cell) + 1 + beyond
+            rank = (route, distance)
+            if best_rank is None or rank < best_rank:
+                best_center = center
+                best_rank = rank
+        return best_center
+
+    def get_grid_pos(self, pos):
+        """Cell under a world position (screen positions go through Camera.to_world first)"""
+        x, y = pos
+        return (int(x // GRID_SIZE), int(y // GRID_SIZE))
 
 class Game:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    def __init__(self, use_enemy_pool=False, headless=False, seed=None, cols=COLS, rows=ROWS,
+                 navigation="flow", profile=False, trace_path=None, record_path=None,
+                 tower_stats=None, snapshot=None, autosave_path=None, endless=False):
+        if record_path and snapshot:
+            # Replays start from a new game, never from a snapshot
+            raise ValueError("A game loaded from a snapshot cannot be recorded")
+        self.headless = headless  # Simulation only: no window and no rendering
+        if not headless:
+            # Only what drawing needs; sound is never started
+            pygame.display.init()
+            pygame.font.init()
+            self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
         self.clock = pygame.time.Clock()
         self.running = True
+        self.use_enemy_pool = use_enemy_pool  # Batched NumPy enemy engine
+
+        # Seeded randomness so simulations can be repeated exactly.
+        # Unseeded games pick a seed of their own so they can still be recorded.
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        self.np_rng = np.random.default_rng(self.seed)
+        self.tick = 0  # Fixed simulation steps taken by step()
+        self.speed = 1  # Simulation steps per frame at 60 FPS (fast-forward)
+        self.scheduler = Scheduler()  # Spawns and shots, run when they are due
+
+        # Frame timings and counters; F3 toggles the overlay
+        self.profiler = profiler
+        self.profiler.reset()  # Shared module-wide, so clear what earlier games measured
+        self.profiler.enabled = profile or trace_path is not None
+        self.profiler.tracing = trace_path is not None
+        self.trace_path = trace_path  # Written by close()
+        self.show_profiler = profile and not headless
         
         # Initialize game components
-        self.grid = Grid()
+        self.grid = Grid(cols, rows)
+        self.camera = Camera((WIDTH, HEIGHT), (self.grid.width, self.grid.height))
+        self.path_workers = None
+        self.setup_navigation(navigation)
         self.wave_manager = WaveManager(self)
+        self.endless = endless  # Generated waves without end instead of the schedule
+        if endless:
+            self.wave_manager.setup_endless(WaveGenerator(self.seed, cols, rows))
+
+        # Session log of every player action, written by close()
+        self.record_path = record_path
+        self.log = None
+        if record_path:
+            self.log = InputLog({"seed": self.seed, "cols": cols, "rows": rows, "navigation": navigation,
+                                 "use_enemy_pool": use_enemy_pool, "endless": endless},
+                                self.wave_manager.schedule())
+
         self.towers = []  # List to store towers
+        self.tower_stats = tower_stats or {}  # Tower keyword arguments for placed towers
+        self.tower_index = SpatialHash(GRID_SIZE)  # Rebuilt once per tick
+        self.tower_reach = 0  # Farthest any tower draws from its center
+        self.projectiles = ProjectileStore(self)  # Bullets from towers and enemies
+        self.towers_destroyed = 0
+
+        # Snapshots: F5 saves, F9 restores, and autosave_path is rewritten every minute
+        self.autosave_path = autosave_path
+        self.quicksave_path = autosave_path or QUICKSAVE_FILE
+        if snapshot:
+            self.restore(snapshot)
         
         # UI elements
-        self.font = pygame.font.Font(None, 36)
+        if not headless:
+            self.font = pygame.font.Font(None, 36)
+            self.labels = {}  # UI slot -> (text, rendered surface)
+
+    def setup_navigation(self, navigation, distances=None):
+        # "flow" reads the shared flow field, "hpa" plans per enemy over clusters,
+        # "async" solves A* per enemy on worker processes. Only the planner in
+        # use is repaired when walls change.
+        if self.path_workers:
+            self.path_workers.close()
+        self.navigation = navigation
+        self.planner = None
+        self.path_workers = None
+        if navigation == "flow":
+            self.grid.track_flow_field(distances)
+        elif navigation == "hpa":
+            self.planner = HierarchicalPlanner(self.grid)
+            self.grid.planners.append(self.planner)
+        elif navigation == "async":
+            self.path_workers = PathWorkers(self.grid)
+        else:
+            raise ValueError(f"Unknown navigation mode: {navigation}")
         
     def run(self):
+        # Fixed timestep: real time (times the game speed) is banked and spent in
+        # whole simulation steps, however many fit into this frame
+        accumulator = 0
+        previous = time.perf_counter()
         while self.running:
-            current_time = pygame.time.get_ticks()
-            
+            now = time.perf_counter()
+            accumulator += min((now - previous) * 1000, MAX_FRAME_MS) * self.speed
+            previous = now
+
             # Handle events
-            self.handle_events()
+            with self.profiler.section("input"):
+                self.handle_events()
             
             # Update
-            self.wave_manager.update(current_time)
-            for tower in self.towers:
-                tower.update(current_time)
+            finished = self.wave_manager.finished
+            while accumulator >= SIM_STEP_MS:
+                self.step()
+                accumulator -= SIM_STEP_MS
+            if self.wave_manager.finished and not finished:
+                print("Game Complete!")
             
             # Draw
-            self.screen.fill(BACKGROUND)
+            self.draw()
             
-            # Draw grid and walls
-            self.grid.draw(self.screen)
-            
-            # Draw towers
-            for tower in self.towers:
-                tower.draw(self.screen)
+            with self.profiler.section("flip"):
+                pygame.display.flip()
+            self.profiler.end_frame()
+            self.clock.tick(60)
+        self.close()
+
+    def update(self, current_time):
+        if self.path_workers:
+            self.path_workers.collect()
+        self.index_towers()
+        with self.profiler.section("events"):
+            self.scheduler.run_until(current_time)
+        with self.profiler.section("waves"):
+            self.wave_manager.update(current_time)
+        with self.profiler.section("projectiles"):
+            self.projectiles.update()
+        if self.path_workers:
+            self.path_workers.submit()  # Everything asked for this frame, in one go
+
+    def close(self):
+        if self.path_workers:
+            self.path_workers.close()
+        if self.trace_path:
+            self.profiler.export(self.trace_path)
+        if self.log:
+            self.save_log()
+
+    def save_log(self):
+        """Write the session recorded so far to record_path"""
+        self.log.ticks = self.tick
+        self.log.save(self.record_path)
+
+    def step(self):
+        """Advance the simulation by one fixed timestep"""
+        self.tick += 1
+        self.update(self.tick * SIM_STEP_MS)
+        if self.autosave_path and self.tick % AUTOSAVE_TICKS == 0:
+            self.save_snapshot(self.autosave_path)
+
+    def save_snapshot(self, path):
+        """Write the whole game state to a compact binary file (NumPy .npz)"""
+        grid = self.grid
+        wave_manager = self.wave_manager
+        enemies = wave_manager.active_enemies
+        store = self.projectiles
+        bullets = np.nonzero(store.alive[:store.used])[0]
+
+        # Bullets refer to their owners by position in the enemy or tower list
+        enemy_slots = {enemy: i for i, enemy in enumerate(enemies)}
+        tower_slots = {tower: i for i, tower in enumerate(self.towers)}
+        owners = [(enemy_slots if store.from_enemy[i] else tower_slots).get(store.owners[i], -1)
+                  for i in bullets.tolist()]
+
+        # Pending events, with each callback stored as what it acts on
+        events = []
+        for time, seq, callback, args in self.scheduler.queue:
+            owner = callback.__self__
+            if owner is wave_manager:
+                if callback.__name__ == "spawn_from":
+                    _, point = args  # Spawns only ever run for the current wave
+                    events.append([time, seq, "spawn", list(point)])
+                else:
+                    events.append([time, seq, "wave"])
+            elif owner in tower_slots:
+                events.append([time, seq, "tower", tower_slots[owner]])
+            elif owner in enemy_slots:
+                events.append([time, seq, "enemy", enemy_slots[owner]])
+
+        header = {
+            "settings": {"seed": self.seed, "cols": grid.cols, "rows": grid.rows,
+                         "navigation": self.navigation, "use_enemy_pool": self.use_enemy_pool,
+                         "endless": self.endless},
+            "base": grid.base,
+            "tick": self.tick,
+            "towers_destroyed": self.towers_destroyed,
+            "rng": self.rng.getstate(),
+            "np_rng": self.np_rng.bit_generator.state,
+            "waves": wave_manager.schedule(),
+            "wave_progress": [wave_manager.current_wave_obj.enemies_spawned,
+                              wave_manager.current_wave_obj.last_spawn_time,
+                              wave_manager.current_wave_obj.is_complete],
+            "wave_manager": {name: getattr(wave_manager, name) for name in WAVE_STATE},
+            "enemy_types": [enemy.type.name for enemy in enemies],
+            "events": events,
+            "next_seq": self.scheduler.seq,
+        }
+        arrays = {
+            "header": np.frombuffer(json.dumps(header).encode(), dtype=np.uint8),
+            "cells": np.frombuffer(grid.cells, dtype=np.uint8),
+            "components": grid.connectivity.labels,
+            "tower_pos": np.array([tower.pos for tower in self.towers]).reshape(-1, 2),
+            "tower_state": np.array([[tower.health, tower.max_health, tower.last_shot_time, tower.range,
+                                      tower.damage, tower.attack_speed]
+                                     for tower in self.towers]).reshape(-1, 6),
+            "enemy_pos": np.array([enemy.pos for enemy in enemies]).reshape(-1, 2),
+            # Enemies killed or arrived this tick are still listed until the next
+            # update counts them, so both flags are kept with the rest
+            "enemy_state": np.array([[enemy.health, enemy.last_shot_time, enemy.patrol_angle,
+                                      enemy.route is not None, enemy.is_dead, enemy.reached_base]
+                                     for enemy in enemies]).reshape(-1, 6),
+            "enemy_waypoint": np.array([(-1, -1) if enemy.waypoint is None else enemy.waypoint
+                                        for enemy in enemies]).reshape(-1, 2),
+            "enemy_patrol_center": np.array([(np.nan, np.nan) if enemy.patrol_center is None
+                                             else enemy.patrol_center
+                                             for enemy in enemies]).reshape(-1, 2),
+            "bullet_owner": np.array(owners, dtype=np.int64),
+        }
+        for name in store.FIELDS:
+            arrays["bullet_" + name] = getattr(store, name)[bullets]
+        if self.navigation == "flow":
+            arrays["distances"] = np.array(grid.flow_field.g)
+        with open(path, "wb") as f:
+            np.savez_compressed(f, **arrays)
+
+    def restore(self, path):
+        """Replace the whole game state with a snapshot written by save_snapshot"""
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        header = json.loads(arrays["header"].tobytes())
+        settings = header["settings"]
+
+        # A restored session can no longer be replayed from its start, so the
+        # recording ends here with everything played up to now
+        if self.log:
+            self.save_log()
+            print(f"Recording stopped at tick {self.tick} by loading {path}; "
+                  f"the session so far is in {self.record_path}")
+            self.log = None
+
+        # Grid and flow field come back as saved; only an HPA* planner is rebuilt
+        self.grid = Grid(settings["cols"], settings["rows"], tuple(header["base"]),
+                         cells=arrays["cells"].tobytes(), components=arrays["components"])
+        self.camera = Camera((WIDTH, HEIGHT), (self.grid.width, self.grid.height))
+        self.setup_navigation(settings["navigation"], arrays.get("distances"))
+        self.use_enemy_pool = settings["use_enemy_pool"]
+        self.seed = settings["seed"]
+        self.endless = settings["endless"]
+        version, state, gauss = header["rng"]
+        self.rng.setstate((version, tuple(state), gauss))
+        self.np_rng.bit_generator.state = header["np_rng"]
+        self.tick = header["tick"]
+        self.towers_destroyed = header["towers_destroyed"]
+
+        self.towers = []
+        for pos, (health, max_health, last_shot_time, range, damage, attack_speed) in zip(
+                arrays["tower_pos"].tolist(), arrays["tower_state"].tolist()):
+            tower = Tower(pos, self, range=range, damage=damage, attack_speed=attack_speed,
+                          health=max_health)
+            tower.health = health
+            tower.last_shot_time = last_shot_time
+            self.towers.append(tower)
+        self.index_towers()
+
+        wave_manager = self.wave_manager = WaveManager(self)
+        if self.endless:
+            wave_manager.setup_endless(WaveGenerator(self.seed, settings["cols"], settings["rows"]))
+        wave_manager.setup_waves(header["waves"])
+        for name, value in header["wave_manager"].items():
+            setattr(wave_manager, name, value)
+        number = max(wave_manager.current_wave, 1)
+        if not wave_manager.generator:
+            number = min(number, len(wave_manager.waves))  # The last wave, once all are played
+        wave = wave_manager.current_wave_obj = wave_manager.wave_at(number)
+        wave.enemies_spawned, wave.last_spawn_time, wave.is_complete = header["wave_progress"]
+
+        rerouted = []
+        for enemy_type, pos, state, waypoint, patrol_center in zip(
+                header["enemy_types"], arrays["enemy_pos"].tolist(), arrays["enemy_state"].tolist(),
+                arrays["enemy_waypoint"].tolist(), arrays["enemy_patrol_center"].tolist()):
+            enemy = wave_manager.spawn_enemy(enemy_type, plan=False)
+            enemy.pos = pygame.Vector2(pos)
+            enemy.health, enemy.last_shot_time, enemy.patrol_angle, routed, is_dead, reached_base = state
+            enemy.is_dead, enemy.reached_base = bool(is_dead), bool(reached_base)
+            enemy.waypoint = tuple(waypoint) if waypoint[0] >= 0 else None
+            enemy.patrol_center = None if math.isnan(patrol_center[0]) else pygame.Vector2(patrol_center)
+            if routed:
+                rerouted.append(enemy)
+        for enemy in rerouted:
+            enemy.calculate_path()  # Per-enemy routes are planned again from where they stand
+        wave_manager.index_enemies()
+
+        store = self.projectiles = ProjectileStore(self)
+        count = len(arrays["bullet_owner"])
+        if count > store.capacity:
+            store.grow(count)
+        for name in store.FIELDS:
+            getattr(store, name)[:count] = arrays["bullet_" + name]
+        store.used = count
+        for i, (owner, from_enemy) in enumerate(zip(arrays["bullet_owner"].tolist(),
+                                                    arrays["bullet_from_enemy"].tolist())):
+            owners = wave_manager.active_enemies if from_enemy else self.towers
+            store.owners[i] = owners[owner] if owner >= 0 else None
+
+        # Replace the events the restored units scheduled with the saved ones
+        self.scheduler = Scheduler()
+        for time, seq, kind, *target in header["events"]:
+            if kind == "spawn":
+                callback, args = wave_manager.spawn_from, (wave_manager.current_wave_obj, tuple(target[0]))
+            elif kind == "wave":
+                callback, args = wave_manager.start_next_wave, ()
+            elif kind == "tower":
+                callback, args = self.towers[target[0]].wake, ()
+            else:
+                callback, args = wave_manager.active_enemies[target[0]].wake, ()
+            self.scheduler.at(time, callback, *args, seq=seq)
+        self.scheduler.seq = header["next_seq"]
+
+    def draw(self):
+        camera = self.camera
+
+        # Draw grid and walls (the cached layer also clears the screen)
+        with self.profiler.section("grid"):
+            self.grid.draw(self.screen, camera)
+        
+        # Only entities in buckets the view touches are drawn, found through
+        # the spatial indexes; margins cover what is drawn around each center.
+        # Each layer is one batch of cached sprites sent with a single blits call.
+        with self.profiler.section("entities"):
+            # Draw towers, their range circles on top
+            towers = self.tower_index.query_rect(*camera.view(self.tower_reach))
+            batch = []
+            add_unit_sprites(batch, camera, towers)
+            for tower in towers:
+                tower.add_range_sprite(batch, camera)
+            self.screen.blits(batch, doreturn=False)
             
             # Draw enemies
-            for enemy in self.wave_manager.active_enemies:
-                enemy.draw(self.screen)
-            
-            # Draw UI
-            self.draw_ui()
-            
-            pygame.display.flip()
-            self.clock.tick(60)
+            batch = []
+            add_unit_sprites(batch, camera, self.wave_manager.enemy_index.query_rect(*camera.view(ENEMY_REACH)))
+            self.screen.blits(batch, doreturn=False)
+
+            # Draw bullets
+            self.projectiles.draw(self.screen, camera)
+        
+        # Draw UI
+        self.draw_ui()
+        if self.show_profiler:
+            self.profiler.draw(self.screen)
+
+    def index_towers(self):
+        """Rebuild the spatial index enemies use for targeting and hits"""
+        self.tower_index.clear()
+        for tower in self.towers:
+            self.tower_index.insert(tower, tower.pos)
+        self.tower_reach = max((tower.range for tower in self.towers), default=0)  # Range circles
+
+    def label(self, slot, text):
+        """Rendered text for one place in the UI, rendered again only when the text changes"""
+        cached = self.labels.get(slot)
+        if cached is None or cached[0] != text:
+            cached = self.labels[slot] = (text, self.font.render(text, True, (255, 255, 255)))
+        return cached[1]
 
     def draw_ui(self):
         # Draw wave information
-        wave_text = f"Wave: {self.wave_manager.current_wave}"
-        enemies_text = f"Enemies: {len(self.wave_manager.active_enemies)}"
-        
-        wave_surface = self.font.render(wave_text, True, (255, 255, 255))
-        enemies_surface = self.font.render(enemies_text, True, (255, 255, 255))
-        
-        self.screen.blit(wave_surface, (10, 10))
-        self.screen.blit(enemies_surface, (10, 50))
+        batch = [
+            (self.label("wave", f"Wave: {self.wave_manager.current_wave}"), (10, 10)),
+            (self.label("enemies", f"Enemies: {len(self.wave_manager.active_enemies)}"), (10, 50)),
+        ]
+
+        if self.speed != 1:
+            batch.append((self.label("speed", f"Speed: {self.speed}x"), (10, 90)))
         
         # If between waves, show countdown
         if self.wave_manager.wave_countdown > 0:
-            countdown_text = f"Next wave in: {self.wave_manager.wave_countdown // 1000}"
-            countdown_surface = self.font.render(countdown_text, True, (255, 255, 255))
-            self.screen.blit(countdown_surface, 
-                           (WIDTH//2 - countdown_surface.get_width()//2, 
-                            HEIGHT//2))
+            countdown_surface = self.label(
+                "countdown", f"Next wave in: {self.wave_manager.wave_countdown // 1000}")
+            batch.append((countdown_surface,
+                          (WIDTH//2 - countdown_surface.get_width()//2, HEIGHT//2)))
+        self.screen.blits(batch, doreturn=False)
 
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 self.running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.show_profiler = not self.show_profiler
+                self.profiler.enabled = self.show_profiler or self.trace_path is not None
+            elif event.type == pygame.KEYDOWN and event.key in SPEEDS:
+                self.speed = SPEEDS[event.key]
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F5:
+                self.save_snapshot(self.quicksave_path)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F9:
+                if os.path.exists(self.quicksave_path):
+                    self.restore(self.quicksave_path)
+            elif event.type == pygame.MOUSEWHEEL:
+                self.camera.zoom_by(event.y, pygame.mouse.get_pos())
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 if event.button == 1:  # Left click for walls
-                    mouse_pos = pygame.mouse.get_pos()
-                    grid_pos = self.grid.get_grid_pos(mouse_pos)
-                    self.grid.toggle_wall(grid_pos)
-                    
-                    # Recalculate paths for all enemies when wall placement changes
-                    for enemy in self.wave_manager.active_enemies:
-                        enemy.calculate_path()
+                    mouse_pos = self.camera.to_world(pygame.mouse.get_pos())
+                    self.apply("wall", self.grid.get_grid_pos(mouse_pos))
                 elif event.button == 3:  # Right click for towers
-                    mouse_pos = pygame.mouse.get_pos()
-                    grid_pos = self.grid.get_grid_pos(mouse_pos)
-                    # Only place towers on empty spaces
-                    if self.grid.grid[grid_pos[1]][grid_pos[0]] == 0:
-                        tower_pos = (grid_pos[0] * GRID_SIZE + GRID_SIZE//2,
-                                   grid_pos[1] * GRID_SIZE + GRID_SIZE//2)
-                        self.towers.append(Tower(tower_pos, self))
+                    mouse_pos = self.camera.to_world(pygame.mouse.get_pos())
+                    self.apply("tower", self.grid.get_grid_pos(mouse_pos))
+
+        # Arrow keys scroll for as long as they are held
+        keys = pygame.key.get_pressed()
+        dx = keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]
+        dy = keys[pygame.K_DOWN] - keys[pygame.K_UP]
+        if dx or dy:
+            self.camera.pan(dx * Camera.PAN_SPEED, dy * Camera.PAN_SPEED)
+
+    def apply(self, action, grid_pos):
+        """Carry out (and record) a player action: "wall" toggles a wall, "tower" places a tower"""
+        if self.log:
+            self.log.actions.append((self.tick, action, grid_pos[0], grid_pos[1]))
+        if action == "wall":
+            self.toggle_wall(grid_pos)
+        elif action == "tower":
+            self.place_tower(grid_pos)
+        else:
+            raise ValueError(f"Unknown action: {action}")
+
+    def toggle_wall(self, grid_pos):
+        self.grid.toggle_wall(grid_pos)
+
+        # Re-read the repaired flow field (O(1) each) or replan for all enemies
+        for enemy in self.wave_manager.active_enemies:
+            enemy.calculate_path()
+
+    def would_seal_base(self, grid_pos):
+        """Whether a wall on grid_pos would cut any wave's spawn point off from the base.
+
+        Scheduled waves count, as do the current wave and, in endless mode,
+        the generated wave after it. Towers never do: enemies walk through
+        tower cells.
+        """
+        wave_manager = self.wave_manager
+        waves = list(wave_manager.waves)
+        if wave_manager.current_wave_obj:
+            waves.append(wave_manager.current_wave_obj)
+        if wave_manager.generator:
+            waves.append(wave_manager.generator.wave(wave_manager.current_wave + 1))
+        spawn_points = {point for wave in waves for point in wave.spawn_points}
+        return self.grid.would_seal_base(grid_pos, spawn_points)
+
+    def place_tower(self, grid_pos):
+        # Only place towers on empty spaces
+        if self.grid.can_place_tower(grid_pos):
+            self.grid.place_tower(grid_pos)
+            tower_pos = (grid_pos[0] * GRID_SIZE + GRID_SIZE//2,
+                         grid_pos[1] * GRID_SIZE + GRID_SIZE//2)
+            self.towers.append(Tower(tower_pos, self, **self.tower_stats))
+
+class InputLog:
+    """A recorded session: game settings, wave schedule and player actions by tick.
+
+    Actions are (tick, action, x, y) and happen just before step() number
+    tick + 1, so replaying them into a game with the same settings and seed
+    plays the session again exactly.
+    """
+    def __init__(self, settings, waves, actions=None, ticks=0):
+        self.settings = settings  # Game keyword arguments, seed included
+        self.waves = waves  # WaveManager.schedule() at the start of the session
+        self.actions = actions if actions is not None else []
+        self.ticks = ticks  # Length of the session
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"settings": self.settings, "waves": self.waves,
+                       "actions": self.actions, "ticks": self.ticks}, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["settings"], data["waves"], [tuple(action) for action in data["actions"]],
+                   data["ticks"])
+
+class Replay:
+    """Plays an InputLog back into a fresh game one tick at a time"""
+    def __init__(self, log, headless=True, **options):
+        self.log = log
+        self.game = Game(headless=headless, **log.settings, **options)
+        self.game.wave_manager.setup_waves(log.waves)
+        self.next_action = 0
+
+    @property
+    def done(self):
+        return self.game.tick >= self.log.ticks
+
+    def step(self):
+        game = self.game
+        actions = self.log.actions
+        while self.next_action < len(actions) and actions[self.next_action][0] <= game.tick:
+            _, action, x, y = actions[self.next_action]
+            game.apply(action, (x, y))
+            self.next_action += 1
+        game.step()
+
+def replay(path, render=False, trace_path=None):
+    """Play a recorded session again, drawing every tick or as a headless run"""
+    session = Replay(InputLog.load(path), headless=not render, trace_path=trace_path)
+    game = session.game
+    while not session.done and game.running:
+        session.step()
+        if render:
+            if any(event.type == pygame.QUIT for event in pygame.event.get()):
+                game.running = False
+            game.draw()
+            pygame.display.flip()
+        game.profiler.end_frame()
+    game.close()
+    return game
+
+def simulate(seed=None, towers=(), walls=(), use_enemy_pool=False, max_ticks=60 * 60 * 60,
+             cols=COLS, rows=ROWS, navigation="flow", trace_path=None, waves=None, tower_stats=None,
+             endless=False):
+    """Play every wave headless with a fixed timestep, as fast as the CPU allows.
+
+    Returns one outcome dict per finished wave and the number of ticks played.
+    A wave still in progress when max_ticks runs out is added as a last
+    outcome with "timed_out" set, so sealed bases still count what spawned
+    and leaked. waves is a schedule for
+    WaveManager.setup_waves and tower_stats the Tower keyword arguments for
+    the placed towers. max_ticks (an hour of game time by default) stops
+    runs whose base is sealed off forever, and endless runs. With navigation="async" paths
+    arrive whenever the workers finish them, so such runs are not exactly
+    repeatable.
+    """
+    game = Game(use_enemy_pool=use_enemy_pool, headless=True, seed=seed, cols=cols, rows=rows,
+                navigation=navigation, trace_path=trace_path, tower_stats=tower_stats, endless=endless)
+    if waves is not None:
+        game.wave_manager.setup_waves(waves)
+    game.grid.set_walls(walls)
+    for grid_pos in towers:
+        game.place_tower(grid_pos)
+
+    while not game.wave_manager.finished and game.tick < max_ticks:
+        game.step()
+        game.profiler.end_frame()
+    game.close()
+    results = list(game.wave_manager.results)
+    if not game.wave_manager.finished:
+        outcome = game.wave_manager.outcome(game.tick * SIM_STEP_MS, timed_out=True)
+        if outcome:
+            results.append(outcome)
+    return results, game.tick
+
+def parse_cell(text):
+    x, y = text.split(",")
+    return (int(x), int(y))
+
+def parse_size(text):
+    cols, rows = text.lower().split("x")
+    return (int(cols), int(rows))
+
+def print_results(results):
+    for result in results:
+        print("Wave {wave}: spawned {spawned}, killed {killed}, leaked {leaked}, "
+              "towers lost {towers_lost}, {duration_ms:.0f} ms".format(**result)
+              + (" (stopped before the wave ended)" if result["timed_out"] else ""))
 
 def main():
-    game = Game()
+    parser = argparse.ArgumentParser(description="Tower defense game")
+    parser.add_argument("--enemy-pool", action="store_true",
+                        help="move enemies with the batched NumPy engine")
+    parser.add_argument("--headless", action="store_true",
+                        help="simulate the waves without a window and print the outcomes")
+    parser.add_argument("--seed", type=int, default=None, help="random seed")
+    parser.add_argument("--size", type=parse_size, default=(COLS, ROWS), metavar="COLSxROWS",
+                        help="map size in cells")
+    parser.add_argument("--navigation", choices=["flow", "hpa", "async"], default="flow",
+                        help="shared flow field, hierarchical A* per enemy for large maps, "
+                             "or A* per enemy on worker processes")
+    parser.add_argument("--tower", type=parse_cell, action="append", default=[],
+                        metavar="X,Y", help="place a tower before a headless run")
+    parser.add_argument("--wall", type=parse_cell, action="append", default=[],
+                        metavar="X,Y", help="place a wall before a headless run")
+    parser.add_argument("--endless", action="store_true",
+                        help="play generated waves that keep getting harder instead of the fixed three")
+    parser.add_argument("--profile", action="store_true",
+                        help="show per-frame timings and counters (toggle with F3)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write per-frame timings and counters to a .csv or .json file on exit")
+    parser.add_argument("--record", metavar="FILE", help="save the session's input log on exit")
+    parser.add_argument("--load", metavar="FILE", help="start from a saved snapshot")
+    parser.add_argument("--autosave", metavar="FILE",
+                        help="save a snapshot every minute of game time (also used by F5/F9)")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="play a recorded session again (without a window when --headless)")
+    args = parser.parse_args()
+    if args.record and args.load:
+        parser.error("--record cannot be combined with --load: replays start from a new game")
+
+    if args.replay:
+        started = time.perf_counter()
+        game = replay(args.replay, render=not args.headless, trace_path=args.trace)
+        print(f"Replayed {game.tick} ticks in {time.perf_counter() - started:.2f} s")
+        print_results(game.wave_manager.results)
+        return
+
+    if args.headless:
+        results, _ = simulate(args.seed, args.tower, args.wall, args.enemy_pool,
+                           cols=args.size[0], rows=args.size[1], navigation=args.navigation,
+                           trace_path=args.trace, endless=args.endless)
+        print_results(results)
+        return
+
+    game = Game(use_enemy_pool=args.enemy_pool, seed=args.seed, cols=args.size[0], rows=args.size[1],
+                navigation=args.navigation, profile=args.profile, trace_path=args.trace,
+                record_path=args.record, snapshot=args.load, autosave_path=args.autosave,
+                endless=args.endless)
     game.run()
 
 if __name__ == "__main__":
     main()
-
-pygame.quit()
+    pygame.quit()
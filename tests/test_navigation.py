@@ -0,0 +1,120 @@
+"""Incremental navigation checked against plain breadth-first searches on random walls"""
+import random
+
+import pytest
+
+import main
+
+COLS, ROWS = 24, 20
+TOGGLES = 300
+
+def bfs(grid, goal):
+    """Steps from every cell to goal, stepping only onto walkable cells"""
+    distances = [float('inf')] * (grid.cols * grid.rows)
+    goal_index = grid.index(goal)
+    distances[goal_index] = 0
+    frontier = [goal_index]
+    for current in frontier:
+        if current != goal_index and not grid.walkable[current]:
+            continue
+        for neighbor in grid.around(current):
+            if distances[neighbor] == float('inf'):
+                distances[neighbor] = distances[current] + 1
+                frontier.append(neighbor)
+    return distances
+
+def reachable(grid, start):
+    """Walkable cell indices reachable from start"""
+    seen = {grid.index(start)}
+    frontier = [grid.index(start)]
+    for current in frontier:
+        for neighbor in grid.around(current):
+            if grid.walkable[neighbor] and neighbor not in seen:
+                seen.add(neighbor)
+                frontier.append(neighbor)
+    return seen
+
+def random_cells(rng, grid, count):
+    return [(rng.randrange(grid.cols), rng.randrange(grid.rows)) for _ in range(count)]
+
+@pytest.mark.parametrize("seed", range(3))
+def test_connectivity_labels(seed):
+    rng = random.Random(seed)
+    grid = main.Grid(COLS, ROWS)
+    for cell in random_cells(rng, grid, TOGGLES):
+        grid.toggle_wall(cell)
+        labels = grid.connectivity.labels
+        for index in range(len(labels)):
+            if not grid.walkable[index]:
+                assert labels[index] == -1
+        # Same label exactly when connected
+        for start in random_cells(rng, grid, 3):
+            if grid.is_wall(start):
+                continue
+            component = reachable(grid, start)
+            label = labels[grid.index(start)]
+            assert {index for index in range(len(labels)) if labels[index] == label} == component
+
+@pytest.mark.parametrize("seed", range(3))
+def test_would_seal(seed):
+    rng = random.Random(seed)
+    grid = main.Grid(COLS, ROWS)
+    grid.set_walls(random_cells(rng, grid, COLS * ROWS // 4))
+    for _ in range(200):
+        cell = (rng.randrange(grid.cols), rng.randrange(grid.rows))
+        sources = [source for source in random_cells(rng, grid, 3) if not grid.is_wall(source)]
+        before = reachable(grid, grid.base)
+        sealed = grid.would_seal_base(cell, sources)
+
+        expected = False
+        if not grid.is_wall(cell) and cell != grid.base:
+            grid.set_wall(cell, True)
+            after = reachable(grid, grid.base)
+            grid.set_wall(cell, False)
+            expected = any(grid.index(source) in before and grid.index(source) not in after
+                           for source in sources if source != cell)
+            # A source the wall lands on steps off it to a neighbor
+            if cell in sources and grid.index(cell) in before:
+                expected = expected or not any(neighbor in after
+                                               for neighbor in grid.around(grid.index(cell)))
+        assert sealed == expected, (cell, sources)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_flow_field_matches_bfs(seed):
+    rng = random.Random(seed)
+    grid = main.Grid(COLS, ROWS)
+    grid.track_flow_field()
+    for cell in random_cells(rng, grid, TOGGLES):
+        grid.toggle_wall(cell)
+        assert grid.flow_field.g == bfs(grid, grid.base)
+
+def test_distance_field_follows_the_walls():
+    rng = random.Random(0)
+    grid = main.Grid(COLS, ROWS)
+    for cell in random_cells(rng, grid, 50):
+        grid.toggle_wall(cell)
+        assert grid.distance_field().g == bfs(grid, grid.base)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_hierarchical_paths_are_walkable(seed):
+    rng = random.Random(seed)
+    grid = main.Grid(COLS, ROWS)
+    planner = main.HierarchicalPlanner(grid, cluster_size=6)
+    grid.planners.append(planner)
+    for cell in random_cells(rng, grid, TOGGLES):
+        grid.toggle_wall(cell)
+        distances = bfs(grid, grid.base)
+        for start in random_cells(rng, grid, 2):
+            if grid.is_wall(start) or start == grid.base:
+                continue
+            path = list(planner.find_path(start, grid.base, grid))
+            if distances[grid.index(start)] == float('inf'):
+                assert path == []
+                continue
+            assert path[-1] == grid.base
+            assert len(path) >= distances[grid.index(start)]
+            previous = start
+            for step in path:
+                assert main.heuristic(previous, step) == 1
+                assert not grid.is_wall(step)
+                previous = step
@@ -0,0 +1,49 @@
+"""Snapshots restore a game exactly: playing on from one gives the same waves"""
+import pytest
+
+import main
+
+TOWERS = [(4, 4), (7, 7), (4, 7), (7, 4), (3, 5), (5, 3)]
+MAX_TICKS = 60 * 60 * 10
+
+def new_game(use_enemy_pool, snapshot=None):
+    game = main.Game(headless=True, seed=7, use_enemy_pool=use_enemy_pool, snapshot=snapshot)
+    if snapshot is None:
+        for grid_pos in TOWERS:
+            game.place_tower(grid_pos)
+    return game
+
+def play(game):
+    while not game.wave_manager.finished and game.tick < MAX_TICKS:
+        game.step()
+    return game.wave_manager.results
+
+def unit_state(game):
+    return [(tuple(enemy.pos), enemy.health, enemy.is_dead, enemy.reached_base)
+            for enemy in game.wave_manager.active_enemies]
+
+@pytest.mark.parametrize("use_enemy_pool", [False, True])
+def test_restore_after_a_kill(tmp_path, use_enemy_pool):
+    # Save right after a tick that killed an enemy, before the next update removes it
+    game = new_game(use_enemy_pool)
+    while not any(enemy.is_dead for enemy in game.wave_manager.active_enemies):
+        game.step()
+        assert game.tick < MAX_TICKS
+    path = tmp_path / "snapshot.npz"
+    game.save_snapshot(path)
+    saved = unit_state(game)
+
+    restored = new_game(use_enemy_pool, snapshot=path)
+    assert restored.tick == game.tick
+    assert unit_state(restored) == saved
+    assert play(restored) == play(game)
+
+def test_restore_matches_an_uninterrupted_game(tmp_path):
+    expected = play(new_game(False))
+
+    game = new_game(False)
+    for _ in range(main.AUTOSAVE_TICKS):
+        game.step()
+    path = tmp_path / "snapshot.npz"
+    game.save_snapshot(path)
+    assert play(new_game(False, snapshot=path)) == expected